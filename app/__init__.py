@@ -37,8 +37,8 @@ def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
 
-    # Redis cache configuration for caching
-    app.config['CACHE_TYPE'] = 'RedisCache'
+    # Redis cache configuration for caching, unless the config picks another backend
+    app.config.setdefault('CACHE_TYPE', 'RedisCache')
     app.config['CACHE_REDIS_URL'] = app.config.get('REDIS_URL', 'redis://localhost:6379/0')
     app.config['CACHE_DEFAULT_TIMEOUT'] = 300  # 5 minutes default
 
@@ -62,12 +62,14 @@ def create_app(config_class=Config):
     app.register_blueprint(auth_bp, url_prefix='/auth')
 
     from app.books.routes import bp as books_bp
+    from app.books import commands  # noqa: F401  registers `flask books ...` commands
     app.register_blueprint(books_bp, url_prefix='/books')
     
     from app.cart.routes import bp as cart_bp
     app.register_blueprint(cart_bp, url_prefix='/api')
 
     from app.reviews.routes import bp as reviews_bp
+    from app.reviews import commands as review_commands  # noqa: F401  registers `flask reviews ...` commands
     app.register_blueprint(reviews_bp, url_prefix='/api')
 
     from app.admin.routes import bp as admin_bp
@@ -1,11 +1,20 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
-from app.models import Book, Order, User, OrderItem
+from app.models import Book, Order, User, OrderItem, OrderStatusEnum
 from app.admin.utils import admin_required
 from sqlalchemy import func
 from datetime import datetime, timedelta, timezone
+import csv
+import io
+import json
 from app.books.routes import invalidate_book_cache
+from app.reviews.routes import review_cache_tags
+from app.reviews.moderation import moderate_reviews
+from app.utils.cache import invalidate_tags, cache_stats
+from app.books.suggest import index_book, unindex_book, reset_suggest_index
+from app.books.importer import read_rows, import_books
+from app.cart.purchases import sync_order_purchases
 
 bp = Blueprint('admin', __name__)
 
@@ -38,7 +47,9 @@ def create_book():
     db.session.add(book)
     db.session.commit()
     
-    invalidate_book_cache()
+    # Also drops any 404s cached under the new id's related/reviews/summary tags
+    invalidate_book_cache(book.id, deleted=True)
+    index_book(book)
 
     return jsonify(book.to_dict()), 201
 
@@ -69,6 +80,7 @@ def update_book(book_id):
     db.session.commit()
 
     invalidate_book_cache(book_id)
+    index_book(book)
     return jsonify(book.to_dict())
 
 @bp.route('/books/<int:book_id>', methods=['DELETE'])
@@ -79,9 +91,87 @@ def delete_book(book_id):
     db.session.delete(book)
     db.session.commit()
 
-    invalidate_book_cache(book_id)
+    invalidate_book_cache(book_id, deleted=True)
+    unindex_book(book_id)
     return jsonify({'message': 'Book deleted successfully'})
 
+@bp.route('/books/import', methods=['POST'])
+@jwt_required()
+@admin_required
+def bulk_import_books():
+    """Upsert books by ISBN from an uploaded CSV or NDJSON file"""
+    upload = request.files.get('file')
+    if not upload:
+        return jsonify({'error': 'A CSV or NDJSON file is required'}), 400
+
+    file_format = request.form.get('format') or upload.filename.rsplit('.', 1)[-1].lower()
+    if file_format not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+    report = import_books(read_rows(stream, file_format))
+
+    # Any existing book may have been updated, so drop every cached book page
+    invalidate_tags('catalog', 'books')
+    reset_suggest_index()
+
+    return jsonify(report)
+
+@bp.route('/books/export', methods=['GET'])
+@jwt_required()
+@admin_required
+def export_books():
+    """Stream the catalog as NDJSON (default) or CSV, optionally only books updated since a timestamp"""
+    export_format = request.args.get('format', 'ndjson')
+    updated_since = request.args.get('updated_since')
+
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+
+    stmt = db.select(Book).order_by(Book.id).execution_options(yield_per=1000)
+    if updated_since:
+        try:
+            since = datetime.fromisoformat(updated_since)
+        except ValueError:
+            return jsonify({'error': 'updated_since must be an ISO 8601 timestamp'}), 400
+        stmt = stmt.where(Book.updated_at >= since)
+
+    # Flat fields only, so NDJSON and CSV rows carry the same columns
+    fields = [name for name in Book.FIELDS if name not in Book.DETAIL_FIELDS]
+
+    def export_row(book):
+        row = book.to_dict(fields=fields)
+        row['updated_at'] = book.updated_at.isoformat() if book.updated_at else None
+        return row
+
+    def generate_ndjson():
+        # yield_per streams rows through a server-side cursor, so memory stays flat
+        for book in db.session.execute(stmt).scalars():
+            yield json.dumps(export_row(book)) + '\n'
+
+    def generate_csv():
+        columns = fields + ['updated_at']
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns)
+        writer.writeheader()
+        for book in db.session.execute(stmt).scalars():
+            writer.writerow(export_row(book))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+        yield buffer.getvalue()
+
+    if export_format == 'csv':
+        generator, mimetype = generate_csv(), 'text/csv'
+    else:
+        generator, mimetype = generate_ndjson(), 'application/x-ndjson'
+
+    return Response(
+        stream_with_context(generator),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=books.{export_format}'}
+    )
+
 # Order Management
 @bp.route('/orders', methods=['GET'])
 @jwt_required()
@@ -152,12 +242,54 @@ def update_order_status(order_id):
         return jsonify({'error': 'Status is required'}), 400
     
     try:
-        order.status = data['status']
-        db.session.commit()
-        return jsonify({'message': 'Order status updated successfully'})
-    except ValueError:
+        status = OrderStatusEnum[str(data['status']).upper()]
+    except KeyError:
         return jsonify({'error': 'Invalid status value'}), 400
+
+    was_completed = order.status == OrderStatusEnum.COMPLETED
+    order.status = status
+    if was_completed != (status == OrderStatusEnum.COMPLETED):
+        db.session.flush()
+        sync_order_purchases(order)
+    db.session.commit()
+    return jsonify({'message': 'Order status updated successfully'})
     
+# Review Moderation
+def is_id(value):
+    # bool is a subclass of int, but true/false are not ids
+    return isinstance(value, int) and not isinstance(value, bool)
+
+@bp.route('/reviews/moderate', methods=['POST'])
+@jwt_required()
+@admin_required
+def moderate_reviews_in_bulk():
+    """Hide, unhide or delete reviews by id list, author and/or book in one transaction"""
+    data = request.get_json(silent=True) or {}
+    review_ids = data.get('review_ids')
+    if review_ids is not None and not (
+        isinstance(review_ids, list) and all(is_id(review_id) for review_id in review_ids)
+    ):
+        return jsonify({'error': 'review_ids must be a list of review ids'}), 400
+    for selector in ('user_id', 'book_id'):
+        if data.get(selector) is not None and not is_id(data[selector]):
+            return jsonify({'error': f'{selector} must be an integer id'}), 400
+
+    try:
+        changed, book_ids, user_ids = moderate_reviews(
+            data.get('action'),
+            review_ids=review_ids,
+            user_id=data.get('user_id'),
+            book_id=data.get('book_id')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    db.session.commit()
+
+    if book_ids:
+        # One invalidation for every affected book and author instead of several per review
+        invalidate_tags(*review_cache_tags(book_ids, user_ids))
+    return jsonify({'action': data['action'], 'reviews': changed, 'book_ids': book_ids})
+
 # User Management
 @bp.route('/users', methods=['GET'])
 @jwt_required()
@@ -230,7 +362,7 @@ def get_sales_report():
         func.count(Order.id).label('num_orders')
     ).filter(
         Order.order_date.between(start_date, end_date),
-        Order.status == 'COMPLETED'
+        Order.status == OrderStatusEnum.COMPLETED
     ).group_by(
         func.date(Order.order_date)
     ).all()
@@ -266,7 +398,7 @@ def get_popular_books_report():
         Order
     ).filter(
         Order.order_date.between(start_date, end_date),
-        Order.status == 'COMPLETED'
+        Order.status == OrderStatusEnum.COMPLETED
     ).group_by(
         Book.id
     ).order_by(
@@ -302,7 +434,7 @@ def get_customer_activity_report():
         Order
     ).filter(
         Order.order_date.between(start_date, end_date),
-        Order.status == 'COMPLETED'
+        Order.status == OrderStatusEnum.COMPLETED
     ).group_by(
         User.id
     ).order_by(
@@ -313,4 +445,12 @@ def get_customer_activity_report():
         'user': user.to_dict(),
         'total_orders': int(total_orders),
         'total_spent': float(total_spent)
-    } for user, total_orders, total_spent in active_customers]) 
\ No newline at end of file
+    } for user, total_orders, total_spent in active_customers]) 
+
+# Cache
+@bp.route('/cache/stats', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_cache_stats():
+    """Per-tier cache hit ratios of the worker process serving the request"""
+    return jsonify(cache_stats())
@@ -0,0 +1,73 @@
+import click
+import os
+import time
+from app import db
+from app.models import Book
+from app.books.routes import bp, invalidate_book_cache
+from app.utils.cache import invalidate_tags
+from app.books.suggest import PrefixIndex, reset_suggest_index
+from app.books.importer import read_rows, import_books
+from app.books.recommendations import build_recommendations
+
+@bp.cli.command('recompute-ratings')
+@click.option('--book-id', type=int, default=None, help='Only repair this book')
+def recompute_ratings(book_id):
+    """Recompute stored rating aggregates from the reviews table"""
+    updated = Book.recompute_ratings([book_id] if book_id else None)
+    db.session.commit()
+    if book_id:
+        invalidate_book_cache(book_id)
+    else:
+        invalidate_tags('catalog', 'books')
+    click.echo(f'Recomputed ratings for {updated} book(s)')
+
+@bp.cli.command('suggest-stats')
+def suggest_stats():
+    """Build the typeahead prefix index and report its size and build time"""
+    index = PrefixIndex()
+    started = time.perf_counter()
+    index.build()
+    elapsed = time.perf_counter() - started
+    stats = index.stats()
+    click.echo(
+        f"{stats['books']} books, {stats['entries']} entries, "
+        f"~{stats['approx_bytes'] / 1024:.1f} KiB, built in {elapsed * 1000:.1f} ms"
+    )
+
+@bp.cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ndjson']), default=None,
+              help='Defaults to the file extension')
+@click.option('--chunk-size', type=int, default=1000, show_default=True)
+def import_catalog(path, file_format, chunk_size):
+    """Bulk upsert books by ISBN from a CSV or NDJSON file"""
+    file_format = file_format or os.path.splitext(path)[1].lstrip('.').lower()
+    with open(path, newline='', encoding='utf-8') as stream:
+        report = import_books(read_rows(stream, file_format), chunk_size=chunk_size)
+
+    invalidate_tags('catalog', 'books')
+    reset_suggest_index()
+
+    for error in report['errors']:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    click.echo(
+        f"Processed {report['processed']} rows: {report['upserted']} upserted, "
+        f"{len(report['errors'])} rejected in {report['elapsed_seconds']}s "
+        f"({report['rows_per_second']} rows/s)"
+    )
+
+@bp.cli.command('build-recommendations')
+@click.option('--top-k', type=int, default=10, show_default=True)
+@click.option('--chunk-size', type=int, default=5000, show_default=True, help='Orders per batch')
+@click.option('--full', is_flag=True, help='Discard stored counts and rescan every order')
+@click.option('--max-basket', type=int, default=50, show_default=True,
+              help='Orders with more distinct books than this are only partly paired')
+def build_recommendations_command(top_k, chunk_size, full, max_basket):
+    """Update "customers also bought" lists from orders placed since the last run"""
+    started = time.perf_counter()
+    report = build_recommendations(top_k=top_k, chunk_size=chunk_size, full=full, max_basket=max_basket)
+    invalidate_tags('related')
+    click.echo(
+        f"Scanned {report['order_items']} order items up to order {report['last_order_id']}, "
+        f"updated {report['books_updated']} book(s) in {time.perf_counter() - started:.1f}s"
+    )
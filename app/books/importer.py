@@ -0,0 +1,161 @@
+import csv
+import json
+import math
+import time
+from datetime import datetime, timezone
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DBAPIError
+from app import db
+from app.models import Book
+
+REQUIRED_FIELDS = ['isbn', 'title', 'author', 'price', 'stock', 'category']
+OPTIONAL_FIELDS = ['description', 'publisher', 'publication_date']
+UPDATABLE_FIELDS = ['title', 'author', 'price', 'stock', 'description', 'publisher', 'publication_date', 'category']
+
+# Largest value Book.price (Numeric(10, 2)) and Book.stock (Integer) can hold
+MAX_PRICE = 10 ** 8
+MAX_STOCK = 2 ** 31 - 1
+
+UPSERT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+def read_rows(stream, file_format):
+    """Yield (line number, row dict or parse error) from a CSV or NDJSON text stream"""
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif file_format == 'ndjson':
+        for line_num, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_num, ValueError(f'Invalid JSON: {e.msg}')
+                continue
+            yield line_num, row if isinstance(row, dict) else ValueError('Expected a JSON object')
+    else:
+        raise ValueError('format must be csv or ndjson')
+
+def validate_row(row):
+    """Coerce an import row to Book column values, raising ValueError on bad data"""
+    missing = [field for field in REQUIRED_FIELDS if row.get(field) in (None, '')]
+    if missing:
+        raise ValueError(f'Missing required fields: {", ".join(missing)}')
+
+    values = {field: row[field] for field in REQUIRED_FIELDS}
+    for field in OPTIONAL_FIELDS:
+        values[field] = row.get(field) or None
+
+    values['isbn'] = str(values['isbn']).strip()
+    try:
+        values['price'] = float(values['price'])
+        values['stock'] = int(values['stock'])
+    except (TypeError, ValueError):
+        raise ValueError('price must be a number and stock an integer')
+    if not (math.isfinite(values['price']) and 0 <= values['price'] < MAX_PRICE):
+        raise ValueError(f'price must be between 0 and {MAX_PRICE}')
+    if not 0 <= values['stock'] <= MAX_STOCK:
+        raise ValueError(f'stock must be between 0 and {MAX_STOCK}')
+    for field in ('isbn', 'title', 'author', 'category', 'publisher'):
+        max_length = Book.__table__.c[field].type.length
+        if values[field] is not None and len(str(values[field])) > max_length:
+            raise ValueError(f'{field} must be at most {max_length} characters')
+    if values['publication_date']:
+        try:
+            values['publication_date'] = datetime.strptime(values['publication_date'], '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            raise ValueError('publication_date must be YYYY-MM-DD')
+    return values
+
+def upsert_books(rows):
+    """Insert or update a chunk of validated rows by ISBN in one statement"""
+    now = datetime.now(timezone.utc)
+    for row in rows:
+        row['updated_at'] = now
+
+    insert = UPSERT_INSERTS.get(db.engine.dialect.name)
+    if insert is not None:
+        stmt = insert(Book.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['isbn'],
+            set_={field: stmt.excluded[field] for field in UPDATABLE_FIELDS + ['updated_at']}
+        )
+        db.session.execute(stmt, rows)
+        return
+
+    # Generic fallback: one lookup for the chunk, then executemany insert/update
+    existing = dict(db.session.query(Book.isbn, Book.id).filter(
+        Book.isbn.in_([row['isbn'] for row in rows])
+    ).all())
+    new_rows = [row for row in rows if row['isbn'] not in existing]
+    updates = [dict(row, id=existing[row['isbn']]) for row in rows if row['isbn'] in existing]
+    if new_rows:
+        db.session.execute(db.insert(Book), new_rows)
+    if updates:
+        db.session.execute(db.update(Book), updates)
+
+def upsert_rows_one_by_one(chunk, errors):
+    """Retry a chunk the database rejected row by row, recording the rows it still rejects"""
+    upserted = 0
+    for line_num, values in chunk:
+        try:
+            upsert_books([values])
+            db.session.commit()
+            upserted += 1
+        except DBAPIError as e:
+            db.session.rollback()
+            errors.append({'line': line_num, 'error': f'Rejected by the database: {str(e.orig).splitlines()[0]}'})
+    return upserted
+
+def import_books(rows, chunk_size=1000):
+    """Validate and upsert (line number, row) pairs in chunks, committing once per chunk.
+
+    A chunk the database rejects is rolled back and retried row by row, so
+    one bad row costs only itself. Returns a report with the number of rows
+    upserted, per-row errors and throughput.
+    """
+    started = time.perf_counter()
+    processed, upserted, errors = 0, 0, []
+    chunk = {}  # isbn -> (line number, values)
+
+    def flush():
+        nonlocal upserted
+        if not chunk:
+            return
+        try:
+            upsert_books([values for _, values in chunk.values()])
+            db.session.commit()
+            upserted += len(chunk)
+        except DBAPIError:
+            db.session.rollback()
+            upserted += upsert_rows_one_by_one(list(chunk.values()), errors)
+        chunk.clear()
+
+    for line_num, row in rows:
+        processed += 1
+        try:
+            if isinstance(row, Exception):
+                raise row
+            values = validate_row(row)
+        except ValueError as e:
+            errors.append({'line': line_num, 'error': str(e)})
+            continue
+        # Later rows for the same ISBN win, as they would row by row
+        chunk.pop(values['isbn'], None)
+        chunk[values['isbn']] = (line_num, values)
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+
+    elapsed = time.perf_counter() - started
+    return {
+        'processed': processed,
+        'upserted': upserted,
+        'errors': sorted(errors, key=lambda error: error['line']),
+        'elapsed_seconds': round(elapsed, 3),
+        'rows_per_second': round(processed / elapsed, 1) if elapsed else None
+    }
@@ -0,0 +1,171 @@
+import numpy as np
+from app import db
+from app.models import (
+    Book, Order, OrderItem, OrderStatusEnum,
+    BookCooccurrence, BookRecommendation, RecommendationRun
+)
+from app.books.importer import UPSERT_INSERTS
+
+def order_item_chunks(after_order_id, chunk_size):
+    """Yield (last order id, order_ids, book_ids) per chunk_size non-cancelled orders.
+
+    order_ids/book_ids are parallel int64 arrays with one entry per order item.
+    """
+    last_order_id = after_order_id
+    while True:
+        order_ids = db.session.execute(
+            db.select(Order.id).where(
+                Order.id > last_order_id,
+                Order.status != OrderStatusEnum.CANCELLED
+            ).order_by(Order.id).limit(chunk_size)
+        ).scalars().all()
+        if not order_ids:
+            return
+
+        rows = db.session.execute(
+            db.select(OrderItem.order_id, OrderItem.book_id).where(
+                OrderItem.order_id.in_(order_ids)
+            )
+        ).all()
+        last_order_id = order_ids[-1]
+        pairs = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        yield last_order_id, pairs[:, 0], pairs[:, 1]
+
+def cooccurrence_counts(order_ids, book_ids, max_basket=50):
+    """Count book pairs bought in the same order.
+
+    Returns (book_ids, related_book_ids, counts) arrays holding each pair in
+    both directions. Pairs are generated by comparing the order-sorted item
+    list against itself shifted by 1..max_basket-1 positions, so the work is
+    vectorised and memory stays proportional to the chunk, not the catalog.
+
+    Each order's books are sorted by id, so in an order with more than
+    `max_basket` distinct books, pairs more than max_basket-1 positions apart
+    are not counted. This keeps huge (e.g. bulk or institutional) orders from
+    dominating the counts; raise it to count them in full.
+    """
+    if len(order_ids) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+
+    # One entry per (order, book) no matter the quantity or duplicate lines
+    items = np.unique(np.stack([order_ids, book_ids], axis=1), axis=0)
+    orders, books = items[:, 0], items[:, 1]
+
+    base = np.int64(books.max() + 1)
+    keys = []
+    for shift in range(1, min(max_basket, len(books))):
+        same_order = orders[:-shift] == orders[shift:]
+        if not same_order.any():
+            break
+        left, right = books[:-shift][same_order], books[shift:][same_order]
+        keys.append(left * base + right)
+        keys.append(right * base + left)
+
+    if not keys:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+
+    pair_keys, counts = np.unique(np.concatenate(keys), return_counts=True)
+    return pair_keys // base, pair_keys % base, counts.astype(np.int64)
+
+def add_cooccurrences(books, related, counts):
+    """Add a chunk's pair counts to book_cooccurrences"""
+    rows = [
+        {'book_id': int(a), 'related_book_id': int(b), 'count': int(c)}
+        for a, b, c in zip(books, related, counts)
+    ]
+    if not rows:
+        return
+
+    insert = UPSERT_INSERTS.get(db.engine.dialect.name)
+    if insert is not None:
+        stmt = insert(BookCooccurrence.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['book_id', 'related_book_id'],
+            set_={'count': BookCooccurrence.__table__.c.count + stmt.excluded['count']}
+        )
+        db.session.execute(stmt, rows)
+        return
+
+    for row in rows:
+        existing = db.session.get(BookCooccurrence, (row['book_id'], row['related_book_id']))
+        if existing:
+            existing.count += row['count']
+        else:
+            db.session.add(BookCooccurrence(**row))
+
+def refresh_top_k(book_ids, top_k, batch_size=500):
+    """Rewrite book_recommendations for the given books from their strongest co-occurrences"""
+    book_ids = sorted(book_ids)
+    for start in range(0, len(book_ids), batch_size):
+        batch = book_ids[start:start + batch_size]
+        ranked = db.select(
+            BookCooccurrence.book_id,
+            BookCooccurrence.related_book_id,
+            BookCooccurrence.count,
+            db.func.row_number().over(
+                partition_by=BookCooccurrence.book_id,
+                order_by=(BookCooccurrence.count.desc(), BookCooccurrence.related_book_id)
+            ).label('position')
+        ).where(BookCooccurrence.book_id.in_(batch)).subquery()
+
+        rows = db.session.execute(
+            db.select(ranked.c.book_id, ranked.c.related_book_id, ranked.c.count)
+            .where(ranked.c.position <= top_k)
+        ).all()
+
+        db.session.execute(db.delete(BookRecommendation).where(BookRecommendation.book_id.in_(batch)))
+        if rows:
+            db.session.execute(db.insert(BookRecommendation), [
+                {'book_id': book_id, 'related_book_id': related_id, 'score': count}
+                for book_id, related_id, count in rows
+            ])
+
+def build_recommendations(top_k=10, chunk_size=5000, full=False, max_basket=50):
+    """Fold orders placed since the last run into the co-occurrence counts and refresh top-K lists.
+
+    Each chunk of orders is committed on its own, together with its refreshed
+    top-K lists and a run record holding the new watermark, so an interrupted
+    job resumes where it stopped. Orders cancelled after being counted are not
+    subtracted; use full=True to rebuild from scratch. `max_basket` bounds the
+    pairs counted per order, see cooccurrence_counts().
+    """
+    if full:
+        db.session.execute(db.delete(BookRecommendation))
+        db.session.execute(db.delete(BookCooccurrence))
+        db.session.execute(db.delete(RecommendationRun))
+        db.session.commit()
+
+    last_run = RecommendationRun.query.order_by(RecommendationRun.id.desc()).first()
+    watermark = last_run.last_order_id if last_run else 0
+
+    processed, touched = 0, set()
+    for last_order_id, order_ids, book_ids in order_item_chunks(watermark, chunk_size):
+        books, related, counts = cooccurrence_counts(order_ids, book_ids, max_basket=max_basket)
+        add_cooccurrences(books, related, counts)
+        chunk_touched = {int(book_id) for book_id in np.unique(books)}
+        refresh_top_k(chunk_touched, top_k)
+
+        db.session.add(RecommendationRun(
+            last_order_id=last_order_id,
+            order_items=len(order_ids),
+            books_updated=len(chunk_touched)
+        ))
+        db.session.commit()
+
+        processed += len(order_ids)
+        touched |= chunk_touched
+        watermark = last_order_id
+
+    return {'order_items': processed, 'books_updated': len(touched), 'last_order_id': watermark}
+
+def related_books(book_id, limit=10):
+    """Precomputed neighbours of a book, strongest first, in one indexed query"""
+    return db.session.query(Book, BookRecommendation.score).join(
+        BookRecommendation, BookRecommendation.related_book_id == Book.id
+    ).filter(
+        BookRecommendation.book_id == book_id
+    ).order_by(
+        BookRecommendation.score.desc(), Book.id
+    ).limit(limit).all()
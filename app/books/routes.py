@@ -1,33 +1,134 @@
-from flask import Blueprint, jsonify, request
-from sqlalchemy import or_, and_
-from app.models import Book
+from flask import Blueprint, jsonify, request, current_app
+from app.models import Book, Review, BookReviewSummary
 from app import db
 from app.utils.rate_limit import ip_limit
-from app.utils.cache import invalidate_cache_pattern, cached
+from app.utils.cache import invalidate_tags, cached
+from app.utils.pagination import keyset_paginate
+from app.utils.etag import conditional
+from app.books.search import search
+from app.books.suggest import get_suggest_index
+from app.books.recommendations import related_books
+from app.reviews.utils import paginate_reviews
 
 bp = Blueprint('books', __name__)
 
-def invalidate_book_cache(book_id=None):
+# Stable orderings usable for both page and cursor pagination; id breaks ties
+BOOK_SORTS = {
+    'id': [Book.id],
+    'price': [Book.price, Book.id],
+    'created_at': [Book.created_at, Book.id],
+}
+
+# Largest value the Integer primary key can hold
+MAX_BOOK_ID = 2 ** 31 - 1
+
+def book_cache_tags(book_ids=(), deleted=False):
+    """Cache tags covering the catalog listings and the given books' detail pages.
+
+    `deleted` adds the books' review, related-books and review-summary entries.
+    """
+    tags = ['catalog']
+    for book_id in book_ids:
+        tags.append(f'book:{book_id}')
+        if deleted:
+            tags.extend([f'book:{book_id}:reviews', f'book:{book_id}:related', f'book:{book_id}:review_summary'])
+    return tags
+
+def invalidate_book_cache(book_id=None, deleted=False):
     """Invalidate book-related caches"""
-    patterns = ['books_list*', 'books_search*', 'books_categories*']
-    if book_id:
-        patterns.append(f'book_{book_id}*')
-    for pattern in patterns:
-        invalidate_cache_pattern(pattern)
+    invalidate_tags(*book_cache_tags([book_id] if book_id else [], deleted=deleted))
 
-@bp.route('/list', methods=['GET'])
-@ip_limit("60 per minute")
-@cached(timeout=10 * 60)
-def list_books():
+def book_version(id):
+    """ETag version of a single book: its updated_at, or None if it doesn't exist"""
+    return db.session.query(Book.updated_at).filter(Book.id == id).scalar()
+
+def catalog_version(*args, **kwargs):
+    """ETag version of the whole catalog: any insert, update or delete changes it"""
+    count, last_update = db.session.query(db.func.count(Book.id), db.func.max(Book.updated_at)).one()
+    return [count, last_update]
+
+def parse_fields(allowed=()):
+    """Parse the `fields=` projection, returning None when every field is wanted"""
+    raw = request.args.get('fields')
+    if not raw:
+        return None
+    fields = {field.strip() for field in raw.split(',') if field.strip()}
+    unknown = fields - set(Book.FIELDS) - set(allowed)
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))}')
+    return fields
+
+def paginate_books(query, search_query=None):
+    """Apply search and pagination from the request args and build the listing response.
+
+    `page`/`per_page` keeps the classic offset pagination. Passing `cursor`
+    (empty for the first page) switches to keyset pagination driven by `sort`,
+    which skips OFFSET and, unless `include_total=true`, the COUNT(*) as well.
+    """
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 10, type=int)
+    cursor = request.args.get('cursor')
+    sort = request.args.get('sort')
+    descending = bool(sort) and sort.startswith('-')
+    sort_key = sort.lstrip('-') if sort else None
+
+    if per_page < 1:
+        return jsonify({'error': 'per_page must be a positive integer'}), 400
+    if sort_key is not None and sort_key not in BOOK_SORTS:
+        return jsonify({'error': f'Invalid sort, expected one of {", ".join(BOOK_SORTS)}'}), 400
+
+    try:
+        fields = parse_fields()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if fields is not None:
+        query = query.options(Book.projection(fields, *BOOK_SORTS[sort_key or 'id']))
+
+    if cursor is not None:
+        include_total = request.args.get('include_total', 'false').lower() == 'true'
+        query = search(query, search_query, ranked=False)
+        total = query.order_by(None).count() if include_total else None
+        try:
+            books, next_cursor = keyset_paginate(
+                query, BOOK_SORTS[sort_key or 'id'], sort or 'id',
+                cursor=cursor, per_page=per_page, descending=descending
+            )
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+        response = {
+            'books': [book.to_dict(fields=fields) for book in books],
+            'per_page': per_page,
+            'next_cursor': next_cursor
+        }
+        if include_total:
+            response['total'] = total
+        return jsonify(response)
+
+    include_total = request.args.get('include_total', 'true').lower() != 'false'
+    query = search(query, search_query, ranked=sort_key is None)
+    if sort_key is not None:
+        columns = BOOK_SORTS[sort_key]
+        query = query.order_by(*(column.desc() if descending else column for column in columns))
+    elif not search_query:
+        query = query.order_by(Book.id)
+
+    pagination = query.paginate(page=page, per_page=per_page, count=include_total)
+
+    return jsonify({
+        'books': [book.to_dict(fields=fields) for book in pagination.items],
+        'total': pagination.total,
+        'page': page,
+        'per_page': per_page,
+        'total_pages': pagination.pages if include_total else None
+    })
+
+def filter_books(query):
+    """Apply the catalog filters shared by /books/list and /books/facets"""
     category = request.args.get('category')
     min_price = request.args.get('min_price', type=float)
     max_price = request.args.get('max_price', type=float)
     min_rating = request.args.get('min_rating', type=float)
-    search_query = request.args.get('q')
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
-    
-    query = Book.query
     
     if category:
         query = query.filter(Book.category == category)
@@ -38,84 +139,180 @@ def list_books():
     if max_price is not None:
         query = query.filter(Book.price <= max_price)
     
-    if search_query:
-        query = query.filter(
-            or_(
-                Book.title.ilike(f'%{search_query}%'),
-                Book.author.ilike(f'%{search_query}%'),
-                Book.description.ilike(f'%{search_query}%')
-            )
-        )
-    
     if min_rating is not None:
-        books_with_ratings = query.all()
-        filtered_books = [book for book in books_with_ratings if book.average_rating >= min_rating]
-        total = len(filtered_books)
-        
-        start = (page - 1) * per_page
-        end = start + per_page
-        paginated_books = filtered_books[start:end]
-        
-        return jsonify({
-            'books': [book.to_dict() for book in paginated_books],
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page
-        })
-    
-    pagination = query.paginate(page=page, per_page=per_page)
+        query = query.filter(Book.average_rating >= min_rating)
     
-    return jsonify({
-        'books': [book.to_dict() for book in pagination.items],
-        'total': pagination.total,
-        'page': page,
-        'per_page': per_page,
-        'total_pages': pagination.pages
-    })
+    return query
+
+@bp.route('/list', methods=['GET'])
+@ip_limit("60 per minute")
+@conditional(catalog_version)
+@cached(timeout=10 * 60, namespace='books_list', tags=('catalog', 'ratings'), xfetch_beta=1.0,
+        stale_ttl=5 * 60)
+def list_books():
+    return paginate_books(filter_books(Book.query), request.args.get('q'))
 
 @bp.route('/<int:id>', methods=['GET'])
 @ip_limit("30 per minute")
-@cached(timeout=5 * 60)
+@conditional(book_version)
+@cached(timeout=5 * 60, namespace='book_{id}', tags=('books', 'book:{id}'), local=True)
 def get_book(id):
-    book = db.session.get(Book, id)
+    try:
+        fields = parse_fields(allowed=('reviews',))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    options = [Book.projection(fields - {'reviews'})] if fields is not None else []
+    book = db.session.get(Book, id, options=options)
     if not book:
         return jsonify({'error': 'Book not found'}), 404
-    return jsonify(book.to_dict(include_reviews=True))
+    if fields is not None and 'reviews' not in fields:
+        return jsonify(book.to_dict(fields=fields, detail=True))
+
+    # Embed only the newest reviews; the cursor continues at /api/books/<id>/reviews
+    reviews, next_cursor = paginate_reviews(
+        Review.query.filter_by(book_id=id, is_hidden=False),
+        per_page=current_app.config.get('BOOK_DETAIL_REVIEWS', 5)
+    )
+    data = book.to_dict(reviews=reviews, fields=fields, detail=True)
+    data['reviews_next_cursor'] = next_cursor
+    return jsonify(data)
+
+@bp.route('/<int:id>/related', methods=['GET'])
+@ip_limit("30 per minute")
+@cached(timeout=60 * 60, namespace='book_{id}_related', tags=('related', 'book:{id}:related'))
+def get_related_books(id):
+    """Customers who bought this book also bought..."""
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    related = related_books(id, limit=limit)
+    # Only an empty list needs the extra lookup to tell a missing book apart
+    if not related and not db.session.get(Book, id):
+        return jsonify({'error': 'Book not found'}), 404
+    return jsonify({
+        'book_id': id,
+        'related': [{'book': book.to_dict(), 'score': score} for book, score in related]
+    })
+
+@bp.route('/<int:id>/review-summary', methods=['GET'])
+@ip_limit("30 per minute")
+@cached(timeout=60 * 60, namespace='book_{id}_review_summary',
+        tags=('review_summaries', 'book:{id}:review_summary'))
+def get_review_summary(id):
+    """Keywords and sentiment precomputed by `flask reviews analyze`"""
+    summary = db.session.get(BookReviewSummary, id)
+    if not summary:
+        return jsonify({'error': 'Review summary not available'}), 404
+    return jsonify(summary.to_dict())
+
+@bp.route('/batch', methods=['GET', 'POST'])
+@ip_limit("60 per minute")
+def get_books_batch():
+    """Fetch several books in one query: ?ids=1,2,3 or a JSON body {"ids": [...]}"""
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        raw_ids = data.get('ids')
+        if not isinstance(raw_ids, list):
+            return jsonify({'error': 'ids must be a list of book ids'}), 400
+        # bool is an int subclass, and int() would truncate floats
+        valid = all(isinstance(book_id, int) and not isinstance(book_id, bool) for book_id in raw_ids)
+    else:
+        raw_ids = [part.strip() for part in request.args.get('ids', '').split(',') if part.strip()]
+        valid = all(part.isdecimal() for part in raw_ids)
+
+    if not valid:
+        return jsonify({'error': 'ids must be integers'}), 400
+    ids = list(dict.fromkeys(int(book_id) for book_id in raw_ids))
+    # Out-of-range values would overflow the Integer id column's bind parameter
+    if not all(1 <= book_id <= MAX_BOOK_ID for book_id in ids):
+        return jsonify({'error': 'ids must be integers'}), 400
+
+    if not ids:
+        return jsonify({'error': 'At least one id is required'}), 400
+
+    max_ids = current_app.config.get('BOOK_BATCH_MAX_IDS', 100)
+    if len(ids) > max_ids:
+        return jsonify({'error': f'At most {max_ids} ids can be requested at once'}), 400
+
+    books = {book.id: book for book in Book.query.filter(Book.id.in_(ids)).all()}
+
+    return jsonify({
+        'books': [books[book_id].to_dict() for book_id in ids if book_id in books],
+        'missing': [book_id for book_id in ids if book_id not in books]
+    })
 
 @bp.route('/search', methods=['GET'])
 @ip_limit("30 per minute")
-@cached(timeout=5 * 60)
+@cached(timeout=5 * 60, namespace='books_search', tags=('catalog', 'ratings'))
 def search_books():
     query = request.args.get('q', '')
     category = request.args.get('category')
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
 
-    search_filter = or_(
-        Book.title.ilike(f'%{query}%'),
-        Book.author.ilike(f'%{query}%'),
-        Book.description.ilike(f'%{query}%')
-    )
+    books_query = Book.query
 
     if category:
-        search_filter = and_(search_filter, Book.category == category)
+        books_query = books_query.filter(Book.category == category)
 
-    pagination = Book.query.filter(search_filter).paginate(
-        page=page, per_page=per_page
-    )
+    return paginate_books(books_query, query)
 
+@bp.route('/suggest', methods=['GET'])
+@ip_limit("120 per minute")
+def suggest_books():
+    prefix = request.args.get('prefix', '')
+    limit = min(request.args.get('limit', 10, type=int), 50)
     return jsonify({
-        'books': [book.to_dict() for book in pagination.items],
-        'total': pagination.total,
-        'page': page,
-        'per_page': per_page,
-        'total_pages': pagination.pages
+        'prefix': prefix,
+        'suggestions': get_suggest_index().suggest(prefix, limit=limit)
+    })
+
+@bp.route('/facets', methods=['GET'])
+@ip_limit("30 per minute")
+@conditional(catalog_version)
+@cached(timeout=10 * 60, namespace='books_facets', tags=('catalog', 'ratings'), stale_ttl=5 * 60)
+def get_facets():
+    """Category, price-range and rating counts for the books matching the list filters"""
+    edges = current_app.config.get('FACET_PRICE_EDGES', [10, 20, 50, 100])
+    price_bucket = db.case(
+        *((Book.price < edge, i) for i, edge in enumerate(edges)),
+        else_=len(edges)
+    ).label('price_bucket')
+    rating_bucket = db.case(
+        (Book.rating_count == 0, 0),
+        *((Book.average_rating >= stars, stars) for stars in range(5, 1, -1)),
+        else_=1
+    ).label('rating_bucket')
+
+    query = search(filter_books(Book.query), request.args.get('q'), ranked=False)
+    rows = query.with_entities(
+        Book.category, price_bucket, rating_bucket, db.func.count(Book.id)
+    ).group_by(Book.category, price_bucket, rating_bucket).all()
+
+    categories, prices, ratings = {}, [0] * (len(edges) + 1), [0] * 6
+    for category, price_index, stars, count in rows:
+        categories[category] = categories.get(category, 0) + count
+        prices[price_index] += count
+        ratings[stars] += count
+
+    bounds = [0] + edges + [None]
+    return jsonify({
+        'total': sum(categories.values()),
+        'categories': [
+            {'category': category, 'count': count}
+            for category, count in sorted(categories.items())
+        ],
+        'price_ranges': [
+            {'min': bounds[i], 'max': bounds[i + 1], 'count': count}
+            for i, count in enumerate(prices)
+        ],
+        'ratings': [
+            {'rating': stars, 'count': count}
+            for stars, count in enumerate(ratings)
+        ]
     })
 
 @bp.route('/categories', methods=['GET'])
 @ip_limit("30 per minute")
-@cached(timeout=60 * 60)
+@conditional(catalog_version)
+@cached(timeout=60 * 60, namespace='books_categories', tags=('catalog',), local=True, stale_ttl=10 * 60)
 def get_categories():
     categories = db.session.query(Book.category).distinct().all()
     return jsonify({
@@ -0,0 +1,116 @@
+import re
+from flask import current_app
+from sqlalchemy import DDL, event, or_
+from app import db
+from app.models import Book
+
+# Shared with the migration so the planner can match the GIN expression index
+PG_SEARCH_VECTOR = (
+    "to_tsvector('english', coalesce(books.title, '') || ' ' || "
+    "coalesce(books.author, '') || ' ' || coalesce(books.description, ''))"
+)
+
+PG_SEARCH_INDEX_DDL = f"CREATE INDEX IF NOT EXISTS ix_books_search ON books USING gin ({PG_SEARCH_VECTOR})"
+
+SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5("
+    "title, author, description, content='books', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN "
+    "INSERT INTO books_fts(rowid, title, author, description) "
+    "VALUES (new.id, new.title, new.author, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN "
+    "INSERT INTO books_fts(books_fts, rowid, title, author, description) "
+    "VALUES ('delete', old.id, old.title, old.author, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE ON books BEGIN "
+    "INSERT INTO books_fts(books_fts, rowid, title, author, description) "
+    "VALUES ('delete', old.id, old.title, old.author, old.description); "
+    "INSERT INTO books_fts(rowid, title, author, description) "
+    "VALUES (new.id, new.title, new.author, new.description); END",
+]
+
+for statement in SQLITE_FTS_DDL:
+    event.listen(Book.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(Book.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS books_fts').execute_if(dialect='sqlite'))
+event.listen(Book.__table__, 'after_create', DDL(PG_SEARCH_INDEX_DDL).execute_if(dialect='postgresql'))
+
+
+def search_tokens(text):
+    """Words of a search string; every backend matches each of them as a prefix"""
+    return re.findall(r'\w+', text)
+
+
+class LikeSearchBackend:
+    """Substring matching over title, author and description (no index)"""
+
+    def apply(self, query, text, ranked=True):
+        return query.filter(
+            or_(
+                Book.title.ilike(f'%{text}%'),
+                Book.author.ilike(f'%{text}%'),
+                Book.description.ilike(f'%{text}%')
+            )
+        )
+
+
+class PostgresSearchBackend:
+    """tsvector search served by the ix_books_search GIN index, ordered by ts_rank_cd"""
+
+    def tsquery_text(self, text):
+        # Bare word tokens can't carry tsquery operators; :* makes each a prefix
+        # match, so `pyth` finds "Python" as it does on SQLite
+        return ' & '.join(f'{token}:*' for token in search_tokens(text))
+
+    def apply(self, query, text, ranked=True):
+        tsquery_text = self.tsquery_text(text)
+        if not tsquery_text:
+            return query.filter(db.false())
+
+        vector = db.literal_column(PG_SEARCH_VECTOR)
+        tsquery = db.func.to_tsquery('english', tsquery_text)
+        query = query.filter(vector.op('@@')(tsquery))
+        if ranked:
+            query = query.order_by(db.func.ts_rank_cd(vector, tsquery).desc(), Book.id)
+        return query
+
+
+class SqliteSearchBackend:
+    """FTS5 search over the books_fts shadow table, ordered by bm25 rank"""
+
+    def match_expression(self, text):
+        # Quote every token so user input can't inject FTS5 syntax; the trailing
+        # * keeps partial words matching like the old ilike search did
+        return ' '.join(f'"{token}"*' for token in search_tokens(text))
+
+    def apply(self, query, text, ranked=True):
+        match = self.match_expression(text)
+        if not match:
+            # Only punctuation: nothing to search for, so nothing matches
+            return query.filter(db.false())
+
+        fts = db.table('books_fts', db.column('rowid'), db.column('rank'))
+        matches = db.select(
+            fts.c.rowid.label('book_id'), fts.c.rank.label('rank')
+        ).where(db.literal_column('books_fts').op('MATCH')(match)).subquery()
+
+        query = query.join(matches, matches.c.book_id == Book.id)
+        if ranked:
+            query = query.order_by(matches.c.rank, Book.id)
+        return query
+
+
+SEARCH_BACKENDS = {
+    'like': LikeSearchBackend(),
+    'postgresql': PostgresSearchBackend(),
+    'sqlite': SqliteSearchBackend(),
+}
+
+def get_search_backend():
+    """Backend named by SEARCH_BACKEND, or the one matching the database dialect"""
+    name = current_app.config.get('SEARCH_BACKEND') or db.engine.dialect.name
+    return SEARCH_BACKENDS.get(name, SEARCH_BACKENDS['like'])
+
+def search(query, text, ranked=True):
+    """Filter a Book query to full-text matches for `text`"""
+    if not text:
+        return query
+    return get_search_backend().apply(query, text, ranked=ranked)
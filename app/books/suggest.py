@@ -0,0 +1,169 @@
+import bisect
+import os
+import sys
+import threading
+import uuid
+from flask import current_app
+from app import db
+from app.models import Book
+from app.utils.cache import broadcast, listen
+
+# Pub/sub channel carrying index changes to the other workers' indexes
+SUGGEST_CHANNEL = 'suggest-index'
+
+_index_lock = threading.Lock()
+
+def normalize(text):
+    return ' '.join(text.lower().split())
+
+class PrefixIndex:
+    """In-memory typeahead index over book titles and authors.
+
+    Keeps a sorted list of (key, kind, book_id) tuples, one per word start of
+    each title/author, so a prefix lookup is a bisect plus a short scan.
+    """
+
+    KINDS = ('title', 'author')
+
+    def __init__(self):
+        self._entries = []
+        self._books = {}  # book_id -> (title, author)
+        self._lock = threading.Lock()
+        self.built = False
+        self.pid = os.getpid()
+        self.origin = uuid.uuid4().hex  # tags this index's own broadcasts
+        self.subscription = None
+
+    @staticmethod
+    def _keys(text):
+        words = normalize(text).split(' ')
+        return {' '.join(words[i:]) for i in range(len(words)) if words[i]}
+
+    def _entries_for(self, book_id, title, author):
+        for kind, text in zip(self.KINDS, (title, author)):
+            for key in self._keys(text or ''):
+                yield (key, kind, book_id)
+
+    def build(self):
+        """(Re)load the index from the books table"""
+        entries, books = [], {}
+        rows = db.session.query(Book.id, Book.title, Book.author).yield_per(1000)
+        for book_id, title, author in rows:
+            books[book_id] = (title, author)
+            entries.extend(self._entries_for(book_id, title, author))
+        entries.sort()
+        with self._lock:
+            self._entries, self._books = entries, books
+            self.built = True
+
+    def add_book(self, book_id, title, author):
+        with self._lock:
+            self._remove(book_id)
+            self._books[book_id] = (title, author)
+            for entry in self._entries_for(book_id, title, author):
+                bisect.insort(self._entries, entry)
+
+    def remove_book(self, book_id):
+        with self._lock:
+            self._remove(book_id)
+
+    def _remove(self, book_id):
+        old = self._books.pop(book_id, None)
+        if old is None:
+            return
+        for entry in self._entries_for(book_id, *old):
+            i = bisect.bisect_left(self._entries, entry)
+            if i < len(self._entries) and self._entries[i] == entry:
+                del self._entries[i]
+
+    def apply(self, change):
+        """Apply a change made by index_book(), unindex_book() or reset_suggest_index()"""
+        if change.get('origin') == self.origin:
+            return  # already applied when it was made
+        if change['op'] == 'reset':
+            self.built = False
+        elif not self.built:
+            return  # the next build reads the change from the database
+        elif change['op'] == 'add':
+            self.add_book(change['book_id'], change['title'], change['author'])
+        elif change['op'] == 'remove':
+            self.remove_book(change['book_id'])
+
+    def suggest(self, prefix, limit=10):
+        """Distinct titles/authors having a word starting with `prefix`"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        results, seen = [], set()
+        with self._lock:
+            i = bisect.bisect_left(self._entries, (prefix,))
+            while i < len(self._entries) and len(results) < limit:
+                key, kind, book_id = self._entries[i]
+                if not key.startswith(prefix):
+                    break
+                value = self._books[book_id][self.KINDS.index(kind)]
+                if (kind, value) not in seen:
+                    seen.add((kind, value))
+                    suggestion = {'type': kind, 'value': value}
+                    if kind == 'title':
+                        suggestion['book_id'] = book_id
+                    results.append(suggestion)
+                i += 1
+        return results
+
+    def stats(self):
+        """Entry counts and an estimate of the bytes held by the index"""
+        with self._lock:
+            size = sys.getsizeof(self._entries) + sys.getsizeof(self._books)
+            for key, kind, book_id in self._entries:
+                size += sys.getsizeof((key, kind, book_id)) + sys.getsizeof(key)
+            for title, author in self._books.values():
+                size += sys.getsizeof((title, author)) + sys.getsizeof(title) + sys.getsizeof(author)
+            return {
+                'books': len(self._books),
+                'entries': len(self._entries),
+                'approx_bytes': size
+            }
+
+def _local_index():
+    index = current_app.extensions.get('book_suggest_index')
+    return index if index is not None and index.pid == os.getpid() else None
+
+def get_suggest_index():
+    """This worker's prefix index, built from the database on first use.
+
+    Each worker process keeps its own copy and follows the changes other
+    workers broadcast, so admin edits show up everywhere.
+    """
+    index = _local_index()
+    if index is None:
+        with _index_lock:
+            index = _local_index()
+            if index is None:
+                index = PrefixIndex()
+                index.subscription = listen(SUGGEST_CHANNEL, index.apply)
+                current_app.extensions['book_suggest_index'] = index
+    if not index.built:
+        index.build()
+    return index
+
+def _publish(change):
+    # Applied here at once, and by every other worker when the broadcast arrives
+    index = _local_index()
+    if index is not None:
+        index.apply(change)
+        change['origin'] = index.origin
+    broadcast(SUGGEST_CHANNEL, change)
+
+def index_book(book):
+    """Add or refresh a book in every worker's prefix index"""
+    _publish({'op': 'add', 'book_id': book.id, 'title': book.title, 'author': book.author})
+
+def unindex_book(book_id):
+    """Drop a book from every worker's prefix index"""
+    _publish({'op': 'remove', 'book_id': book_id})
+
+def reset_suggest_index():
+    """Make every worker rebuild its index on next use, e.g. after a bulk import"""
+    _publish({'op': 'reset'})
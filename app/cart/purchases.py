@@ -0,0 +1,48 @@
+from app import db
+from app.models import Order, OrderItem, OrderStatusEnum, PurchasedBook, Review
+
+def refresh_purchases(user_id=None, book_ids=None):
+    """Rebuild purchased_books rows from completed orders, optionally for one user's books.
+
+    Each (user, book) pair points at the earliest completed order containing it,
+    so cancelling one of several orders for a book keeps the entitlement.
+    """
+    delete = db.delete(PurchasedBook)
+    source = db.select(
+        Order.user_id,
+        OrderItem.book_id,
+        db.func.min(Order.id),
+        db.func.min(Order.order_date)
+    ).join(OrderItem, OrderItem.order_id == Order.id).where(
+        Order.status == OrderStatusEnum.COMPLETED
+    ).group_by(Order.user_id, OrderItem.book_id)
+
+    if user_id is not None:
+        delete = delete.where(PurchasedBook.user_id == user_id)
+        source = source.where(Order.user_id == user_id)
+    if book_ids is not None:
+        delete = delete.where(PurchasedBook.book_id.in_(book_ids))
+        source = source.where(OrderItem.book_id.in_(book_ids))
+
+    db.session.execute(delete)
+    db.session.execute(db.insert(PurchasedBook).from_select(
+        ['user_id', 'book_id', 'order_id', 'purchased_at'], source
+    ))
+
+def sync_order_purchases(order):
+    """Grant or revoke the entitlements of an order whose status changed"""
+    book_ids = [book_id for book_id, in db.session.query(OrderItem.book_id).filter_by(order_id=order.id)]
+    if book_ids:
+        refresh_purchases(order.user_id, book_ids)
+
+def has_purchased(user_id, book_id):
+    """Primary-key lookup of a user's entitlement to a book"""
+    return db.session.get(PurchasedBook, (int(user_id), book_id)) is not None
+
+def purchased_books(user_id):
+    """A user's purchased books with whether each has been reviewed yet, newest first"""
+    return db.session.query(PurchasedBook, Review.id).outerjoin(
+        Review, db.and_(Review.user_id == PurchasedBook.user_id, Review.book_id == PurchasedBook.book_id)
+    ).filter(
+        PurchasedBook.user_id == user_id
+    ).order_by(PurchasedBook.purchased_at.desc(), PurchasedBook.book_id).all()
@@ -5,6 +5,8 @@ from app import db
 from app.models import Cart, CartItem, Book, Order, OrderItem, OrderStatusEnum
 from sqlalchemy.orm.exc import NoResultFound
 from app.utils.rate_limit import user_limit
+from app.utils.cache import invalidate_tags
+from app.books.routes import book_cache_tags
 
 
 bp = Blueprint('cart', __name__)
@@ -214,9 +216,12 @@ def complete_checkout():
             cart_item.book.stock -= cart_item.quantity
             db.session.add(order_item)
 
+        sold_book_ids = sorted({cart_item.book_id for cart_item in cart.items})
         CartItem.query.filter_by(cart_id=cart.id).delete()
         
         db.session.commit()
+        # Stock changed, so the books' detail pages and the catalog listings are stale
+        invalidate_tags(*book_cache_tags(sold_book_ids))
 
         return jsonify({
             'message': 'Order placed successfully',
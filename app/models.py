@@ -1,5 +1,7 @@
 from datetime import datetime, timezone, timedelta
 from flask_login import UserMixin
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import load_only
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db
 from time import time
@@ -74,40 +76,156 @@ class Book(db.Model):
     isbn = db.Column(db.String(255), unique=True, nullable=False)
     title = db.Column(db.String(255), nullable=False)
     author = db.Column(db.String(255), nullable=False)
-    price = db.Column(db.Numeric(10, 2), nullable=False)
+    price = db.Column(db.Numeric(10, 2), nullable=False, index=True)
     stock = db.Column(db.Integer, default=0)
     description = db.Column(db.Text)
     publisher = db.Column(db.String(255))
     publication_date = db.Column(db.Date)
-    category = db.Column(db.String(225), nullable=False)
+    category = db.Column(db.String(225), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Per-star review counts, kept in step with rating_count by _bump_ratings
+    rating_1_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_2_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_3_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_4_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_5_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Bumped by admin edits and review writes; drives ETags and incremental exports
+    updated_at = db.Column(
+        db.DateTime,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+        index=True
+    )
     
     reviews = db.relationship('Review', backref='book', lazy='dynamic')
     order_items = db.relationship('OrderItem', backref='book', lazy='dynamic')
 
-    @property
+    @hybrid_property
     def average_rating(self):
-        reviews = self.reviews.all()
-        if not reviews:
+        if not self.rating_count:
             return 0
-        return sum(review.rating for review in reviews) / len(reviews)
+        return self.rating_sum / self.rating_count
+
+    @average_rating.expression
+    def average_rating(cls):
+        return db.case(
+            (cls.rating_count > 0, db.cast(cls.rating_sum, db.Float) / cls.rating_count),
+            else_=0
+        )
+
+    STARS = range(1, 6)
+    HISTOGRAM_COLUMNS = tuple(f'rating_{star}_count' for star in STARS)
+
+    @property
+    def rating_histogram(self):
+        return {str(star): getattr(self, f'rating_{star}_count') for star in self.STARS}
+
+    @staticmethod
+    def _rating_increments(added=None, removed=None):
+        """Column increments for adding and/or removing one rating"""
+        # Deltas are computed as ints here; bools bound into the SQL break on PostgreSQL
+        values = {
+            'rating_count': Book.rating_count + (int(added is not None) - int(removed is not None)),
+            'rating_sum': Book.rating_sum + (added or 0) - (removed or 0),
+            'updated_at': datetime.now(timezone.utc)
+        }
+        if added != removed:
+            if added is not None:
+                name = f'rating_{added}_count'
+                values[name] = getattr(Book, name) + 1
+            if removed is not None:
+                name = f'rating_{removed}_count'
+                values[name] = getattr(Book, name) - 1
+        return values
+
+    def _bump_ratings(self, added=None, removed=None):
+        # Applied as an in-database increment so concurrent review writes don't lose updates
+        values = self._rating_increments(added, removed)
+        db.session.execute(
+            db.update(Book).where(Book.id == self.id).values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.expire(self, list(values))
+
+    def add_rating(self, rating):
+        """Count a new review's rating in the stored aggregates"""
+        self._bump_ratings(added=rating)
+
+    def change_rating(self, old_rating, new_rating):
+        """Swap an edited review's rating in the stored aggregates"""
+        # Applied even when the rating is unchanged so updated_at tracks the edit
+        self._bump_ratings(added=new_rating, removed=old_rating)
+
+    def remove_rating(self, rating):
+        """Drop a deleted review's rating from the stored aggregates"""
+        self._bump_ratings(removed=rating)
+
+    @staticmethod
+    def recompute_ratings(book_ids=None):
+        """Rebuild rating_count/rating_sum and the star histogram from visible reviews"""
+        def visible(*criteria):
+            return db.and_(Review.book_id == Book.id, Review.is_hidden.is_(False), *criteria)
+
+        count = db.select(db.func.count(Review.id)).where(visible()).scalar_subquery()
+        total = db.select(db.func.coalesce(db.func.sum(Review.rating), 0)).where(visible()).scalar_subquery()
+        stars = {
+            f'rating_{star}_count': db.select(db.func.count(Review.id)).where(
+                visible(Review.rating == star)
+            ).scalar_subquery()
+            for star in Book.STARS
+        }
+        stmt = db.update(Book).values(
+            rating_count=count, rating_sum=total, updated_at=datetime.now(timezone.utc), **stars
+        ).execution_options(synchronize_session=False)
+        if book_ids is not None:
+            stmt = stmt.where(Book.id.in_(book_ids))
+        return db.session.execute(stmt).rowcount
     
-    def to_dict(self, include_reviews=False):
+    # Serialized field -> (columns it reads, getter). Drives to_dict() and the
+    # fields= projection, which only loads the columns the requested fields need.
+    FIELDS = {
+        'id': (('id',), lambda book: book.id),
+        'isbn': (('isbn',), lambda book: book.isbn),
+        'title': (('title',), lambda book: book.title),
+        'author': (('author',), lambda book: book.author),
+        'price': (('price',), lambda book: float(book.price)),
+        'stock': (('stock',), lambda book: book.stock),
+        'description': (('description',), lambda book: book.description),
+        'publisher': (('publisher',), lambda book: book.publisher),
+        'publication_date': (('publication_date',),
+            lambda book: book.publication_date.isoformat() if book.publication_date else None),
+        'category': (('category',), lambda book: book.category),
+        'average_rating': (('rating_count', 'rating_sum'), lambda book: book.average_rating),
+        'rating_count': (('rating_count',), lambda book: book.rating_count),
+        'rating_histogram': (HISTOGRAM_COLUMNS, lambda book: book.rating_histogram),
+    }
+    # Left out of listings unless asked for with fields=; the detail view always has them
+    DETAIL_FIELDS = {'rating_histogram'}
+
+    @classmethod
+    def projection(cls, fields, *extra_columns):
+        """A load_only() option covering the columns needed to serialize `fields`"""
+        columns = {'id'}
+        for field in fields:
+            columns.update(cls.FIELDS[field][0])
+        return load_only(*(getattr(cls, name) for name in sorted(columns)), *extra_columns)
+
+    def to_dict(self, reviews=None, fields=None, detail=False):
+        """Serialize the book; `reviews` embeds an already-loaded page of its reviews.
+
+        Without `fields`, DETAIL_FIELDS are only included when `detail` is set.
+        """
+        if fields is None:
+            fields = self.FIELDS.keys() if detail else self.FIELDS.keys() - self.DETAIL_FIELDS
         data = {
-            'id': self.id,
-            'isbn': self.isbn,
-            'title': self.title,
-            'author': self.author,
-            'price': float(self.price),
-            'stock': self.stock,
-            'description': self.description,
-            'publisher': self.publisher,
-            'publication_date': self.publication_date.isoformat() if self.publication_date else None,
-            'category': self.category,
-            'average_rating': self.average_rating
+            name: getter(self)
+            for name, (_, getter) in self.FIELDS.items()
+            if name == 'id' or name in fields
         }
 
-        if include_reviews:
+        if reviews is not None:
             data['reviews'] = [
                 {
                     'id': review.id,
@@ -119,7 +237,7 @@ class Book(db.Model):
                         'username': review.author.username
                     }
                 }
-                for review in self.reviews.order_by(Review.created_at.desc()).all()
+                for review in reviews
             ]
             
         return data
@@ -131,6 +249,10 @@ class OrderStatusEnum(Enum):
 
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        db.Index('ix_orders_user_id_order_date', 'user_id', 'order_date'),
+        db.Index('ix_orders_status_order_date', 'status', 'order_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -145,21 +267,30 @@ class OrderItem(db.Model):
     __tablename__ = 'order_items'
     
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
-    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False)
     price_at_time = db.Column(db.Numeric(10, 2), nullable=False)
 
 class Review(db.Model):
     __tablename__ = 'reviews'
+    __table_args__ = (
+        # Listing orders end with id as a tie-break, so the indexes do too
+        db.Index('ix_reviews_book_id_created_at_id', 'book_id', 'created_at', 'id'),
+        db.Index('ix_reviews_book_id_rating_created_at_id', 'book_id', 'rating', 'created_at', 'id'),
+        db.Index('ix_reviews_user_id_book_id', 'user_id', 'book_id'),
+        db.Index('ix_reviews_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
     rating = db.Column(db.Integer, nullable=False)  # 1-5 stars
     comment = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
-    updated_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), onupdate=datetime.utcnow) 
+    # Hidden by moderation: kept for its author but left out of listings and aggregates
+    is_hidden = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
     def to_dict(self):
         return {
@@ -168,6 +299,7 @@ class Review(db.Model):
             'book_id': self.book_id,
             'rating': self.rating,
             'comment': self.comment,
+            'is_hidden': self.is_hidden,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
             'user': {
@@ -180,7 +312,7 @@ class Cart(db.Model):
     __tablename__ = 'carts'
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
     updated_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
 
@@ -208,6 +340,9 @@ class Cart(db.Model):
     
 class CartItem(db.Model):
     __tablename__ = 'cart_items'
+    __table_args__ = (
+        db.Index('uq_cart_items_cart_id_book_id', 'cart_id', 'book_id', unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     cart_id = db.Column(db.Integer, db.ForeignKey('carts.id'), nullable=False)
@@ -226,4 +361,75 @@ class CartItem(db.Model):
             'book': self.book.to_dict(),
             'quantity': self.quantity,
             'subtotal': float(self.subtotal)
-        } 
\ No newline at end of file
+        }
+
+class BookCooccurrence(db.Model):
+    """How many orders contained both books (stored in both directions)"""
+    __tablename__ = 'book_cooccurrences'
+
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), primary_key=True)
+    related_book_id = db.Column(db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class BookRecommendation(db.Model):
+    """Top-K "customers also bought" neighbours per book, rebuilt by the recommendations job"""
+    __tablename__ = 'book_recommendations'
+
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), primary_key=True)
+    related_book_id = db.Column(db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Integer, nullable=False)
+
+class RecommendationRun(db.Model):
+    __tablename__ = 'recommendation_runs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    last_order_id = db.Column(db.Integer, nullable=False)
+    order_items = db.Column(db.Integer, nullable=False, default=0)
+    books_updated = db.Column(db.Integer, nullable=False, default=0)
+    finished_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+class PurchasedBook(db.Model):
+    """Books a user has bought in a completed order; gates who may review what"""
+    __tablename__ = 'purchased_books'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id', ondelete='CASCADE'), nullable=False)
+    purchased_at = db.Column(db.DateTime)
+
+class ReviewAnalysis(db.Model):
+    """Sentiment and term counts for one review, as of the review's updated_at"""
+    __tablename__ = 'review_analyses'
+
+    review_id = db.Column(db.Integer, db.ForeignKey('reviews.id', ondelete='CASCADE'), primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), nullable=False, index=True)
+    review_updated_at = db.Column(db.DateTime)
+    sentiment = db.Column(db.Float, nullable=False)  # VADER compound score, -1..1
+    terms = db.Column(db.JSON, nullable=False)  # {term: count}
+
+class BookReviewSummary(db.Model):
+    """Per-book keywords and sentiment aggregated from review_analyses by the batch job"""
+    __tablename__ = 'book_review_summaries'
+
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), primary_key=True)
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+    average_sentiment = db.Column(db.Float)
+    positive_count = db.Column(db.Integer, nullable=False, default=0)
+    neutral_count = db.Column(db.Integer, nullable=False, default=0)
+    negative_count = db.Column(db.Integer, nullable=False, default=0)
+    keywords = db.Column(db.JSON, nullable=False)  # [{'term': ..., 'count': ...}], most frequent first
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    def to_dict(self):
+        return {
+            'book_id': self.book_id,
+            'review_count': self.review_count,
+            'average_sentiment': self.average_sentiment,
+            'sentiment': {
+                'positive': self.positive_count,
+                'neutral': self.neutral_count,
+                'negative': self.negative_count
+            },
+            'keywords': self.keywords,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
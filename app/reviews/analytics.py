@@ -0,0 +1,172 @@
+import multiprocessing
+from collections import Counter
+from datetime import datetime, timezone
+from nltk.corpus import stopwords
+from nltk.sentiment import SentimentIntensityAnalyzer
+from nltk.tokenize import RegexpTokenizer
+from app import db
+from app.models import Review, ReviewAnalysis, BookReviewSummary
+
+NLTK_RESOURCES = ('vader_lexicon', 'stopwords')
+
+# VADER's conventional cut-offs for calling a text positive or negative
+POSITIVE_THRESHOLD = 0.05
+NEGATIVE_THRESHOLD = -0.05
+
+_tokenizer = RegexpTokenizer(r"[a-z][a-z']+")
+_analyzer = None
+_stopwords = None
+
+def load_nltk_resources():
+    """Load the VADER lexicon and stopword list once per process.
+
+    Raises LookupError naming the missing corpora if they haven't been downloaded.
+    """
+    global _analyzer, _stopwords
+    if _analyzer is None:
+        try:
+            _analyzer = SentimentIntensityAnalyzer()
+            _stopwords = frozenset(stopwords.words('english'))
+        except LookupError as e:
+            raise LookupError(
+                f'Missing nltk data; run: python -m nltk.downloader {" ".join(NLTK_RESOURCES)}'
+            ) from e
+    return _analyzer, _stopwords
+
+def analyze_comments(batch):
+    """Score (review_id, comment) pairs; runs in the pool workers, so no database access.
+
+    Returns (review_id, compound sentiment, {term: count}) tuples.
+    """
+    analyzer, stop = load_nltk_resources()
+    results = []
+    for review_id, comment in batch:
+        text = comment or ''
+        terms = Counter(
+            token.strip("'") for token in _tokenizer.tokenize(text.lower())
+            if token not in stop and len(token.strip("'")) > 2
+        )
+        results.append((review_id, analyzer.polarity_scores(text)['compound'], dict(terms)))
+    return results
+
+def stale_reviews(chunk_size):
+    """Yield chunks of reviews that are new or edited since they were last analyzed"""
+    last_id = 0
+    while True:
+        rows = db.session.query(
+            Review.id, Review.book_id, Review.comment, Review.updated_at
+        ).outerjoin(
+            ReviewAnalysis, ReviewAnalysis.review_id == Review.id
+        ).filter(
+            Review.id > last_id,
+            Review.is_hidden.is_(False),
+            db.or_(
+                ReviewAnalysis.review_id.is_(None),
+                ReviewAnalysis.review_updated_at.is_distinct_from(Review.updated_at)
+            )
+        ).order_by(Review.id).limit(chunk_size).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+        yield rows
+
+def drop_orphaned_analyses():
+    """Delete analyses of reviews since deleted or hidden, returning the affected book ids"""
+    orphaned = db.session.query(ReviewAnalysis.review_id, ReviewAnalysis.book_id).filter(
+        ~db.exists().where(Review.id == ReviewAnalysis.review_id, Review.is_hidden.is_(False))
+    ).all()
+    if orphaned:
+        db.session.execute(db.delete(ReviewAnalysis).where(
+            ReviewAnalysis.review_id.in_([review_id for review_id, _ in orphaned])
+        ))
+    return {book_id for _, book_id in orphaned}
+
+def refresh_summaries(book_ids, keywords=10, batch_size=500):
+    """Rebuild book_review_summaries for the given books from their stored review analyses"""
+    book_ids = sorted(book_ids)
+    now = datetime.now(timezone.utc)
+    for start in range(0, len(book_ids), batch_size):
+        batch = book_ids[start:start + batch_size]
+        stats = {book_id: {'sentiments': [], 'terms': Counter()} for book_id in batch}
+        rows = db.session.query(
+            ReviewAnalysis.book_id, ReviewAnalysis.sentiment, ReviewAnalysis.terms
+        ).filter(ReviewAnalysis.book_id.in_(batch))
+        for book_id, sentiment, terms in rows:
+            stats[book_id]['sentiments'].append(sentiment)
+            stats[book_id]['terms'].update(terms)
+
+        db.session.execute(db.delete(BookReviewSummary).where(BookReviewSummary.book_id.in_(batch)))
+        summaries = []
+        for book_id, book_stats in stats.items():
+            sentiments = book_stats['sentiments']
+            if not sentiments:
+                continue
+            top_terms = sorted(book_stats['terms'].items(), key=lambda item: (-item[1], item[0]))[:keywords]
+            summaries.append({
+                'book_id': book_id,
+                'review_count': len(sentiments),
+                'average_sentiment': round(sum(sentiments) / len(sentiments), 4),
+                'positive_count': sum(1 for s in sentiments if s >= POSITIVE_THRESHOLD),
+                'negative_count': sum(1 for s in sentiments if s <= NEGATIVE_THRESHOLD),
+                'neutral_count': sum(1 for s in sentiments if NEGATIVE_THRESHOLD < s < POSITIVE_THRESHOLD),
+                'keywords': [{'term': term, 'count': count} for term, count in top_terms],
+                'updated_at': now
+            })
+        if summaries:
+            db.session.execute(db.insert(BookReviewSummary), summaries)
+
+def analyze_reviews(chunk_size=1000, processes=None, keywords=10, full=False):
+    """Score new and edited reviews in a process pool and refresh the affected book summaries.
+
+    Each chunk's analyses and summaries are committed together, so an
+    interrupted run picks up from the first review still out of date.
+    With processes=1 the work runs inline instead of in a pool.
+    """
+    load_nltk_resources()
+    if full:
+        db.session.execute(db.delete(BookReviewSummary))
+        db.session.execute(db.delete(ReviewAnalysis))
+        db.session.commit()
+
+    touched = drop_orphaned_analyses()
+    if touched:
+        refresh_summaries(touched, keywords)
+        db.session.commit()
+
+    processes = processes or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(processes, initializer=load_nltk_resources) if processes > 1 else None
+    analyzed = 0
+    try:
+        for rows in stale_reviews(chunk_size):
+            pairs = [(row.id, row.comment) for row in rows]
+            if pool:
+                per_task = max(1, len(pairs) // (processes * 4))
+                batches = [pairs[i:i + per_task] for i in range(0, len(pairs), per_task)]
+                results = [result for batch in pool.map(analyze_comments, batches) for result in batch]
+            else:
+                results = analyze_comments(pairs)
+
+            reviews = {row.id: row for row in rows}
+            db.session.execute(db.delete(ReviewAnalysis).where(ReviewAnalysis.review_id.in_(list(reviews))))
+            db.session.execute(db.insert(ReviewAnalysis), [
+                {
+                    'review_id': review_id,
+                    'book_id': reviews[review_id].book_id,
+                    'review_updated_at': reviews[review_id].updated_at,
+                    'sentiment': sentiment,
+                    'terms': terms
+                }
+                for review_id, sentiment, terms in results
+            ])
+            chunk_books = {row.book_id for row in rows}
+            refresh_summaries(chunk_books, keywords)
+            db.session.commit()
+
+            analyzed += len(rows)
+            touched |= chunk_books
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    return {'reviews_analyzed': analyzed, 'books_updated': len(touched)}
@@ -0,0 +1,23 @@
+import click
+import time
+from app.reviews.routes import bp
+from app.reviews.analytics import analyze_reviews
+from app.utils.cache import invalidate_tags
+
+@bp.cli.command('analyze')
+@click.option('--chunk-size', type=int, default=1000, show_default=True, help='Reviews per batch')
+@click.option('--processes', type=int, default=None, help='Worker processes [default: CPU count]')
+@click.option('--keywords', type=int, default=10, show_default=True, help='Keywords kept per book')
+@click.option('--full', is_flag=True, help='Discard stored analyses and rescore every review')
+def analyze_reviews_command(chunk_size, processes, keywords, full):
+    """Score new and edited reviews and refresh per-book keyword and sentiment summaries"""
+    started = time.perf_counter()
+    try:
+        report = analyze_reviews(chunk_size=chunk_size, processes=processes, keywords=keywords, full=full)
+    except LookupError as e:
+        raise click.ClickException(str(e))
+    invalidate_tags('review_summaries')
+    click.echo(
+        f"Analyzed {report['reviews_analyzed']} review(s), "
+        f"updated {report['books_updated']} book summary(ies) in {time.perf_counter() - started:.1f}s"
+    )
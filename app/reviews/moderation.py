@@ -0,0 +1,44 @@
+from app import db
+from app.models import Book, Review
+
+MODERATION_ACTIONS = ('hide', 'unhide', 'delete')
+
+def moderate_reviews(action, review_ids=None, user_id=None, book_id=None):
+    """Hide, unhide or delete every review matching all the given selectors in set-based statements.
+
+    Rating aggregates are recomputed once per affected book. The caller commits.
+    Returns (number of reviews changed, affected book ids, affected author ids).
+    """
+    if action not in MODERATION_ACTIONS:
+        raise ValueError(f'action must be one of {", ".join(MODERATION_ACTIONS)}')
+
+    criteria = []
+    if review_ids is not None:
+        criteria.append(Review.id.in_(review_ids))
+    if user_id is not None:
+        criteria.append(Review.user_id == user_id)
+    if book_id is not None:
+        criteria.append(Review.book_id == book_id)
+    if not criteria:
+        raise ValueError('Select reviews by review_ids, user_id or book_id')
+    if action == 'hide':
+        criteria.append(Review.is_hidden.is_(False))
+    elif action == 'unhide':
+        criteria.append(Review.is_hidden.is_(True))
+
+    affected = db.session.execute(
+        db.select(Review.book_id, Review.user_id).where(*criteria).distinct()
+    ).all()
+    if not affected:
+        return 0, [], []
+    book_ids = sorted({book_id for book_id, _ in affected})
+    user_ids = sorted({user_id for _, user_id in affected})
+
+    if action == 'delete':
+        stmt = db.delete(Review).where(*criteria)
+    else:
+        stmt = db.update(Review).where(*criteria).values(is_hidden=action == 'hide')
+    changed = db.session.execute(stmt.execution_options(synchronize_session=False)).rowcount
+
+    Book.recompute_ratings(book_ids)
+    return changed, book_ids, user_ids
@@ -1,44 +1,64 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
-from app.models import Review, Book, Order, OrderItem
-from sqlalchemy import and_
+from app.models import Review, Book
 from app.utils.rate_limit import ip_limit, user_limit
-from app.utils.cache import cached, invalidate_cache_pattern
-from app.books.routes import invalidate_book_cache
+from app.utils.cache import cached, invalidate_tags
+from app.utils.etag import conditional
+from app.reviews.utils import paginate_reviews, with_next_page
+from app.books.routes import book_version
+from app.cart.purchases import has_purchased, purchased_books
 
 bp = Blueprint('reviews', __name__)
 
-def invalidate_review_cache(book_id=None, review_id=None):
-    """Invalidate review-related caches"""
-    patterns = []
-    if book_id:
-        patterns.extend([f'book_{book_id}_reviews*', f'book_{book_id}*'])
-    if review_id:
-        patterns.append(f'review_{review_id}*')
-    patterns.append('user_reviews*')
-    for pattern in patterns:
-        invalidate_cache_pattern(pattern)
-
-def has_purchased_book(user_id, book_id):
-    """Check if user has purchased the book"""
-    return OrderItem.query.join(Order).filter(
-        and_(
-            Order.user_id == user_id,
-            OrderItem.book_id == book_id,
-            Order.status == 'COMPLETED'
-        )
-    ).first() is not None
+def review_cache_tags(book_ids=(), user_ids=()):
+    """Cache tags affected by review writes on the given books by the given users"""
+    # Listings show ratings, but review writes never change categories
+    tags = ['ratings']
+    for book_id in book_ids:
+        tags.extend([f'book:{book_id}', f'book:{book_id}:reviews'])
+    tags.extend(f'user:{user_id}:reviews' for user_id in user_ids)
+    return tags
+
+def invalidate_review_cache(book_id, user_id):
+    """Invalidate caches showing a book's reviews or ratings, or the author's reviews"""
+    invalidate_tags(*review_cache_tags([book_id], [user_id]))
 
 @bp.route('/books/<int:book_id>/reviews', methods=['GET'])
 @ip_limit("30 per minute")
-@cached(timeout=5 * 60)
+@conditional(lambda book_id: book_version(book_id))
+@cached(timeout=5 * 60, namespace='book_{book_id}_reviews', tags=('book:{book_id}:reviews',))
 def get_book_reviews(book_id):
-    book = db.session.get(Book, book_id)
+    try:
+        reviews, next_cursor = paginate_reviews(
+            Review.query.filter_by(book_id=book_id, is_hidden=False),
+            sort=request.args.get('sort', 'newest'),
+            cursor=request.args.get('cursor'),
+            per_page=max(1, min(request.args.get('per_page', 20, type=int), 100))
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # Only an empty page needs the extra lookup to tell a missing book apart
+    if not reviews and not db.session.get(Book, book_id):
+        return jsonify({'error': 'Book not found'}), 404
+    response = jsonify([review.to_dict() for review in reviews])
+    return with_next_page(response, 'reviews.get_book_reviews', next_cursor, book_id=book_id)
+
+@bp.route('/books/<int:book_id>/rating-summary', methods=['GET'])
+@ip_limit("60 per minute")
+@conditional(lambda book_id: book_version(book_id))
+def get_rating_summary(book_id):
+    """Average, count and star histogram from the book's stored counters"""
+    fields = ['average_rating', 'rating_count', 'rating_histogram']
+    book = db.session.get(Book, book_id, options=[Book.projection(fields)])
     if not book:
         return jsonify({'error': 'Book not found'}), 404
-    reviews = Review.query.filter_by(book_id=book_id).all()
-    return jsonify([review.to_dict() for review in reviews])
+    return jsonify({
+        'book_id': book.id,
+        'average_rating': book.average_rating,
+        'rating_count': book.rating_count,
+        'histogram': book.rating_histogram
+    })
 
 @bp.route('/books/<int:book_id>/reviews', methods=['POST'])
 @jwt_required()
@@ -56,7 +76,7 @@ def create_review(book_id):
     
     book = Book.query.get_or_404(book_id)
 
-    if not has_purchased_book(user_id, book_id):
+    if not has_purchased(user_id, book_id):
         return jsonify({'error': 'You can only review books you have purchased'}), 403
     
     existing_review = Review.query.filter_by(user_id=user_id, book_id=book_id).first()
@@ -70,10 +90,10 @@ def create_review(book_id):
         comment=data['comment']
     )
     db.session.add(review)
+    book.add_rating(rating)
     db.session.commit()
 
-    invalidate_review_cache(book_id=book_id)
-    invalidate_book_cache(book_id)
+    invalidate_review_cache(book_id, user_id)
 
     return jsonify(review.to_dict()), 201
 
@@ -96,12 +116,13 @@ def update_review(review_id):
     if not 1 <= rating <= 5:
         return jsonify({'error': 'Rating must be between 1 and 5'}), 400
     
+    if not review.is_hidden:
+        review.book.change_rating(review.rating, rating)
     review.rating = rating
     review.comment = data['comment']
     db.session.commit()
 
-    invalidate_review_cache(book_id=review.book_id, review_id=review_id)
-    invalidate_book_cache(review.book_id)
+    invalidate_review_cache(review.book_id, review.user_id)
 
     return jsonify(review.to_dict())
 
@@ -112,24 +133,48 @@ def delete_review(review_id):
     user_id = get_jwt_identity()
     review = Review.query.get_or_404(review_id)
 
-    if review.user_id != user_id:
+    if int(review.user_id) != int(user_id):
         return jsonify({'error': 'You can only delete your own reviews'}), 403
     
     book_id = review.book_id
+    if not review.is_hidden:
+        review.book.remove_rating(review.rating)
     db.session.delete(review)
     db.session.commit()
 
-    invalidate_review_cache(book_id=book_id, review_id=review_id)
-    invalidate_book_cache(book_id)
+    invalidate_review_cache(book_id, user_id)
 
     return jsonify({'message': 'Review deleted successfully'})
 
 @bp.route('/users/reviews', methods=['GET'])
 @jwt_required()
 @user_limit("30 per minute")
-@cached(timeout=5 * 60)
+@cached(timeout=5 * 60, namespace='user_reviews', per_user=True,
+        tags=('user:{user}:reviews',))
 def get_user_reviews():
-    """Get all reviews by the current user"""
+    """Get the current user's reviews, one page at a time"""
+    user_id = get_jwt_identity()
+    try:
+        reviews, next_cursor = paginate_reviews(
+            Review.query.filter_by(user_id=user_id),
+            sort=request.args.get('sort', 'newest'),
+            cursor=request.args.get('cursor'),
+            per_page=max(1, min(request.args.get('per_page', 20, type=int), 100))
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    response = jsonify([review.to_dict() for review in reviews])
+    return with_next_page(response, 'reviews.get_user_reviews', next_cursor)
+
+@bp.route('/users/purchased-books', methods=['GET'])
+@jwt_required()
+@user_limit("30 per minute")
+def get_purchased_books():
+    """Books the current user may review, flagging the ones already reviewed"""
     user_id = get_jwt_identity()
-    reviews = Review.query.filter_by(user_id=user_id).all()
-    return jsonify([review.to_dict() for review in reviews]) 
\ No newline at end of file
+    return jsonify([{
+        'book_id': purchase.book_id,
+        'order_id': purchase.order_id,
+        'purchased_at': purchase.purchased_at.isoformat() if purchase.purchased_at else None,
+        'review_id': review_id
+    } for purchase, review_id in purchased_books(user_id)])
\ No newline at end of file
@@ -0,0 +1,32 @@
+from flask import request, url_for
+from sqlalchemy.orm import joinedload
+from app.models import Review
+from app.utils.pagination import keyset_paginate
+
+# Sort name -> (key columns, descending); the trailing id keeps the order stable
+REVIEW_SORTS = {
+    'newest': ([Review.created_at, Review.id], True),
+    'highest': ([Review.rating, Review.created_at, Review.id], True),
+    'lowest': ([Review.rating, Review.created_at, Review.id], False),
+}
+
+def paginate_reviews(query, sort='newest', cursor=None, per_page=20):
+    """One page of reviews with their authors loaded in the same query.
+
+    Returns the reviews and the cursor for the next page (None on the last page).
+    Raises ValueError for an unknown sort or a malformed cursor.
+    """
+    if sort not in REVIEW_SORTS:
+        raise ValueError(f'Invalid sort, expected one of {", ".join(REVIEW_SORTS)}')
+    columns, descending = REVIEW_SORTS[sort]
+    query = query.options(joinedload(Review.author))
+    return keyset_paginate(query, columns, sort, cursor=cursor, per_page=per_page, descending=descending)
+
+def with_next_page(response, endpoint, next_cursor, **values):
+    """Advertise the next page of a list response via X-Next-Cursor and Link headers"""
+    if next_cursor:
+        args = dict(request.args.items())
+        args.update(values, cursor=next_cursor)
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{url_for(endpoint, **args)}>; rel="next"'
+    return response
@@ -1,49 +1,432 @@
 from flask_caching import Cache
 from functools import wraps
-from flask import request, current_app
+from flask import request, current_app, g
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from collections import defaultdict
+from redis.exceptions import WatchError
+from app.utils.local_cache import CacheStats, LocalTier, RefreshPool, Subscription
+import gzip
 import hashlib
 import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+import uuid
+import zlib
+
+try:
+    import lz4.frame
+except ImportError:  # optional; CACHE_COMPRESSION='lz4' falls back to gzip without it
+    lz4 = None
+
+logger = logging.getLogger(__name__)
 
 cache = Cache()
+_process_lock = threading.Lock()
+
+# Part of every key's hash; bump it when the stored entry layout changes so
+# entries written by older code are never read back
+CACHE_ENTRY_FORMAT = 3
 
-def generate_cache_key(*args, **kwargs):
-    """Generate a cache key based on the function arguments and query parameters"""
+# Pub/sub channel carrying keys evicted by invalidate_tags() to every worker's L1
+INVALIDATION_CHANNEL = 'cache-invalidate'
+
+def generate_cache_key(namespace, *args, **kwargs):
+    """Build a `<namespace>:<hash>` cache key.
+
+    The namespace keeps keys readable (e.g. `book_42:<hash>`); the hash
+    covers the view arguments and query parameters.
+    """
     # Include query parameters in the cache key
     query_params = dict(request.args)
     # Sort to ensure consistent ordering
     key_parts = {
         'args': args,
         'kwargs': kwargs,
-        'query': sorted(query_params.items())
+        'query': sorted(query_params.items()),
+        'format': CACHE_ENTRY_FORMAT
     }
     # Convert to string and hash
     key_str = json.dumps(key_parts, sort_keys=True)
-    return hashlib.md5(key_str.encode()).hexdigest()
+    return f'{namespace}:{hashlib.md5(key_str.encode()).hexdigest()}'
+
+def cached(timeout=5 * 60, namespace=None, per_user=False, tags=(), local=False, xfetch_beta=None,
+           stale_ttl=None):# Default 5 minutes
+    """Custom caching decorator that includes query parameters in the cache key.
 
-def cached(timeout=5 * 60):# Default 5 minutes
-    """Custom caching decorator that includes query parameters in the cache key"""
+    `namespace` and `tags` are formatted with the view arguments (plus `user`
+    when `per_user` is set), e.g. namespace='book_{id}', tags=('book:{id}',).
+    The namespace defaults to the view name; `per_user` adds the JWT identity
+    so each user gets their own entry: `user_reviews:<user id>:<hash>`.
+    Writes evict entries through invalidate_tags().
+
+    With `local` set and CACHE_L1_ENABLED on, responses are also kept in the
+    worker's in-process L1 cache (at most CACHE_L1_TTL seconds), which is
+    checked before Redis.
+
+    On a miss only one worker recomputes the entry (see _single_flight()).
+    `xfetch_beta` turns on probabilistic early recomputation: a hit is
+    refreshed ahead of expiry with a probability that grows as expiry nears
+    and with how long the view took to compute; higher values refresh earlier.
+
+    With `stale_ttl`, an entry older than `timeout` is kept for `stale_ttl`
+    more seconds and served as is while a background thread recomputes it
+    (see _refresh_stale()). Invalidated entries are deleted outright, never
+    served stale.
+
+    Entries hold the response's serialized body, status and headers rather
+    than the pickled response; see _freeze_response(). Under conditional(),
+    the headers include the ETag of the version the body was built from, so
+    hits are served and revalidated without looking the version up again.
+    """
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
+            etag_func = g.pop('etag_func', None)
             if not current_app.config.get('CACHE_ENABLED', True):
-                return f(*args, **kwargs)
-            
-            cache_key = generate_cache_key(*args, **kwargs)
-            rv = cache.get(cache_key)
-            if rv is not None:
-                return rv
-            rv = f(*args, **kwargs)
-            cache.set(cache_key, rv, timeout=timeout)
-            return rv
+                return _render(lambda: f(*args, **kwargs), etag_func)
+
+            values = dict(kwargs)
+            key_namespace = (namespace or f.__name__).format(**values)
+            if per_user:
+                values['user'] = get_jwt_identity()
+                key_namespace = f'{key_namespace}:{values["user"]}'
+            cache_key = generate_cache_key(key_namespace, *args, **kwargs)
+            stats = _cache_stats()
+            l1 = _local_tier() if local else None
+            if l1 is not None:
+                entry = l1.cache.get(cache_key)
+                stats.record('l1', entry is not None)
+                if entry is not None:
+                    return _thaw_response(entry)
+
+            def compute():
+                return _recompute(cache_key, lambda: f(*args, **kwargs), timeout,
+                    [tag.format(**values) for tag in tags], stale_ttl, etag_func)
+
+            entry = cache.get(cache_key)
+            stats.record('l2', entry is not None)
+            stale = False
+            if entry is None:
+                payload = _single_flight(cache_key, compute)
+            else:
+                payload, expires_at, delta = entry
+                stale = bool(stale_ttl) and time.time() >= expires_at
+                if stale:
+                    _refresh_stale(cache_key, compute, per_user)
+                elif xfetch_beta and _expires_early(expires_at, delta, xfetch_beta):
+                    payload = _refresh_early(cache_key, compute, payload)
+                if stale_ttl:
+                    stats.incr('stale' if stale else 'fresh')
+            # A stale value stays out of the L1 so the refreshed one is picked up from Redis
+            if l1 is not None and not stale:
+                l1.cache.set(cache_key, payload, ttl=timeout)
+            return _thaw_response(payload)
+        decorated_function.stores_etag = True
         return decorated_function
     return decorator
 
-def invalidate_cache_pattern(pattern):
-     """Invalidate all cache keys matching the given pattern"""
-     if hasattr(cache, '_client'): # For Redis
-        for key in cache._client.scan_iter(pattern):
-            cache.delete(key)
+def _render(view, etag_func=None):
+    """Run the view, tagging a 200 response with the ETag from conditional()'s `etag_func`.
+
+    The version is read before the view runs, so the ETag is never newer than the body.
+    """
+    etag = etag_func() if etag_func is not None else None
+    response = current_app.make_response(view())
+    if etag is not None and response.status_code == 200:
+        response.set_etag(etag)
+    return response
+
+def _recompute(cache_key, view, timeout, tags, stale_ttl=None, etag_func=None):
+    """Run the view and store its serialized response with its expiry time and compute duration"""
+    started = time.time()
+    payload = _freeze_response(_render(view, etag_func))
+    now = time.time()
+    cache.set(cache_key, (payload, now + timeout, now - started), timeout=timeout + (stale_ttl or 0))
+    tag_cache_key(cache_key, tags)
+    return payload
+
+def _expires_early(expires_at, delta, beta):
+    # XFetch: -log(U) is exponentially distributed, so a rare request refreshes
+    # well ahead of expiry and the chance rises as it nears
+    return time.time() - delta * beta * math.log(1.0 - random.random()) >= expires_at
+
+def _lock_name(cache_key):
+    return f'{cache.cache.key_prefix}lock:{cache_key}'
+
+def _acquire_lock(client, cache_key):
+    """Take the recompute lock for `cache_key`, returning its token or None if another worker holds it"""
+    token = uuid.uuid4().hex
+    ttl = current_app.config.get('CACHE_LOCK_TIMEOUT', 10)
+    if client.set(_lock_name(cache_key), token, nx=True, px=int(ttl * 1000)):
+        return token
+    return None
+
+def _release_lock(client, cache_key, token):
+    # Only delete the lock if it is still ours; it may have expired and been taken by another worker
+    name = _lock_name(cache_key)
+    with client.pipeline() as pipe:
+        try:
+            pipe.watch(name)
+            if pipe.get(name) == token.encode():
+                pipe.multi()
+                pipe.delete(name)
+                pipe.execute()
+        except WatchError:
+            pass
+
+def _single_flight(cache_key, compute):
+    """Recompute a missing entry with at most one worker doing so at a time.
+
+    The worker that takes the Redis lock recomputes; the others poll the cache
+    for its result. A waiter takes over if the lock is released without a
+    value, and computes on its own after CACHE_LOCK_WAIT seconds rather than
+    fail the request. Non-Redis backends live in one process and just compute.
+    """
+    client = _redis_client()
+    if client is None:
+        return compute()
+    config = current_app.config
+    deadline = time.monotonic() + config.get('CACHE_LOCK_WAIT', 5)
+    while True:
+        token = _acquire_lock(client, cache_key)
+        if token is not None:
+            try:
+                return compute()
+            finally:
+                _release_lock(client, cache_key, token)
+        if time.monotonic() >= deadline:
+            return compute()
+        time.sleep(config.get('CACHE_LOCK_POLL_INTERVAL', 0.05))
+        entry = cache.get(cache_key)
+        if entry is not None:
+            return entry[0]
+
+def _refresh_early(cache_key, compute, payload):
+    """Recompute ahead of expiry if no other worker already is; otherwise keep serving `payload`"""
+    client = _redis_client()
+    if client is None:
+        return compute()
+    token = _acquire_lock(client, cache_key)
+    if token is None:
+        return payload
+    try:
+        return compute()
+    finally:
+        _release_lock(client, cache_key, token)
+
+def _refresh_pool():
+    pool = current_app.extensions.get('cache_refresh_pool')
+    if pool is None or pool.pid != os.getpid():
+        with _process_lock:
+            pool = current_app.extensions.get('cache_refresh_pool')
+            if pool is None or pool.pid != os.getpid():
+                pool = RefreshPool(
+                    workers=current_app.config.get('CACHE_REFRESH_WORKERS', 4),
+                    max_pending=current_app.config.get('CACHE_REFRESH_MAX_PENDING', 32)
+                )
+                current_app.extensions['cache_refresh_pool'] = pool
+    return pool
+
+def _refresh_stale(cache_key, compute, per_user):
+    """Recompute a stale entry on the worker's refresh pool, outside the request.
+
+    The refresh replays the current request (query string, JWT) in its own
+    request context. Nothing is queued if this or another worker is already
+    refreshing the key, or if the pool is at CACHE_REFRESH_MAX_PENDING.
+    """
+    app = current_app._get_current_object()
+    environ = dict(request.environ)
+    stats = _cache_stats()
+    client = _redis_client()
+
+    def refresh():
+        with app.request_context(environ):
+            token = _acquire_lock(client, cache_key) if client is not None else None
+            if client is not None and token is None:
+                return
+            try:
+                if per_user:
+                    verify_jwt_in_request()
+                compute()
+                stats.incr('refreshed')
+            except Exception:
+                stats.incr('refresh_failed')
+                logger.exception('Background refresh of cache key %s failed', cache_key)
+            finally:
+                if token is not None:
+                    _release_lock(client, cache_key, token)
+
+    if not _refresh_pool().submit(cache_key, refresh):
+        stats.incr('refresh_rejected')
+
+def _compress(body):
+    """Return (encoding, body), compressing bodies of CACHE_COMPRESS_MIN_BYTES or more"""
+    config = current_app.config
+    if len(body) < config.get('CACHE_COMPRESS_MIN_BYTES', 1024):
+        return None, body
+    if config.get('CACHE_COMPRESSION') == 'lz4' and lz4 is not None:
+        return 'lz4', lz4.frame.compress(body)
+    # gzip framing around zlib's deflate, so hits can be sent to clients as is
+    return 'gzip', gzip.compress(body, compresslevel=6, mtime=0)
+
+def _decompress(encoding, body):
+    if encoding == 'lz4':
+        return lz4.frame.decompress(body)
+    if encoding == 'gzip':
+        return zlib.decompress(body, wbits=31)
+    return body
+
+def _freeze_response(rv):
+    """Serialize a view's return value to (encoding, body, status, headers) for caching.
+
+    Storing bytes instead of the response object keeps pickling off the hit
+    path and lets each hit build a fresh response, which after_request hooks
+    are free to modify.
+    """
+    response = current_app.make_response(rv)
+    encoding, body = _compress(response.get_data())
+    headers = [(name, value) for name, value in response.headers.items() if name != 'Content-Length']
+    return encoding, body, response.status_code, headers
+
+def _thaw_response(payload):
+    """Build a response from a cached payload, passing gzip bodies through to clients that accept them"""
+    encoding, body, status, headers = payload
+    response = current_app.response_class(status=status, headers=headers)
+    if encoding == 'gzip' and current_app.config.get('CACHE_SERVE_GZIP', True):
+        response.vary.add('Accept-Encoding')
+        if request.accept_encodings['gzip']:
+            response.headers['Content-Encoding'] = 'gzip'
+            # A gzip-encoded body is a different representation, so it gets its own tag
+            etag, weak = response.get_etag()
+            if etag is not None:
+                response.set_etag(f'{etag}-gzip', weak)
+            response.set_data(body)
+            return response
+    response.set_data(_decompress(encoding, body))
+    return response
+
+def _local_tier():
+    """This worker's L1 tier, created on first use; None unless CACHE_L1_ENABLED"""
+    if not current_app.config.get('CACHE_L1_ENABLED'):
+        return None
+    tier = current_app.extensions.get('cache_l1')
+    # A tier inherited across a fork has no listener thread, so each process builds its own
+    if tier is None or tier.pid != os.getpid():
+        with _process_lock:
+            tier = current_app.extensions.get('cache_l1')
+            if tier is None or tier.pid != os.getpid():
+                tier = LocalTier(
+                    _redis_client(),
+                    channel_name(INVALIDATION_CHANNEL),
+                    max_items=current_app.config.get('CACHE_L1_MAX_ITEMS', 1024),
+                    ttl=current_app.config.get('CACHE_L1_TTL', 30)
+                )
+                current_app.extensions['cache_l1'] = tier
+    return tier
+
+def _cache_stats():
+    stats = current_app.extensions.get('cache_stats')
+    if stats is None or stats.pid != os.getpid():
+        stats = current_app.extensions['cache_stats'] = CacheStats()
+    return stats
+
+def cache_stats():
+    """Hit/miss counts and hit ratios per tier for the current worker process"""
+    report = _cache_stats().snapshot()
+    tier = current_app.extensions.get('cache_l1')
+    report['l1']['enabled'] = bool(current_app.config.get('CACHE_L1_ENABLED'))
+    report['l1']['size'] = len(tier.cache) if tier is not None and tier.pid == os.getpid() else 0
+    report['pid'] = os.getpid()
+    return report
+
+def channel_name(name):
+    """Redis pub/sub channel `name`, namespaced like the cache keys"""
+    return f'{current_app.config.get("CACHE_KEY_PREFIX") or ""}{name}'
+
+def broadcast(name, message):
+    """Publish a JSON message on channel `name` to every worker sharing the Redis cache.
+
+    A no-op with non-Redis backends, which only ever serve one process.
+    """
+    client = _redis_client()
+    if client is not None:
+        client.publish(channel_name(name), json.dumps(message))
+
+def listen(name, handler):
+    """Call handler(message) in a background thread for each broadcast() on `name`.
+
+    Returns the Subscription, or None with non-Redis backends.
+    """
+    client = _redis_client()
+    return Subscription(client, channel_name(name), handler) if client is not None else None
+
+def _evict_local(keys):
+    """Evict `keys` (or '*') from the L1 of this worker and, over pub/sub, every other one"""
+    if not current_app.config.get('CACHE_L1_ENABLED'):
+        return
+    tier = current_app.extensions.get('cache_l1')
+    if tier is not None and tier.pid == os.getpid():
+        tier.evict(keys)
+    broadcast(INVALIDATION_CHANNEL, keys)
+
+def _redis_client():
+    return getattr(cache.cache, '_write_client', None)  # Redis backends only
+
+def _tag_set_name(tag):
+    return f'{cache.cache.key_prefix}tag:{tag}'
+
+def _local_tags():
+    # Non-Redis backends (simple, null) live in one process, so the tag sets can too
+    return current_app.extensions.setdefault('cache_tags', defaultdict(set))
+
+def tag_cache_key(cache_key, tags):
+    """Record `cache_key` as a member of each tag, for invalidate_tags()"""
+    if not tags:
+        return
+    client = _redis_client()
+    if client is None:
+        for tag in tags:
+            _local_tags()[tag].add(cache_key)
+        return
+    ttl = current_app.config.get('CACHE_TAG_TTL', 24 * 60 * 60)
+    pipe = client.pipeline(transaction=False)
+    for tag in tags:
+        pipe.sadd(_tag_set_name(tag), cache_key)
+        pipe.expire(_tag_set_name(tag), ttl)
+    pipe.execute()
+
+def invalidate_tags(*tags):
+    """Delete every cache entry carrying any of `tags`.
+
+    Costs one round trip to read and clear the tag sets plus one delete of
+    their members, however many other keys the cache holds. The keys are also
+    broadcast so every worker drops them from its L1.
+    """
+    tags = [tag for tag in tags if tag]
+    if not tags:
+        return 0
+    client = _redis_client()
+    if client is None:
+        keys = set()
+        for tag in tags:
+            keys |= _local_tags().pop(tag, set())
+    else:
+        pipe = client.pipeline(transaction=True)
+        for tag in tags:
+            pipe.smembers(_tag_set_name(tag))
+        pipe.delete(*(_tag_set_name(tag) for tag in tags))
+        *members, _ = pipe.execute()
+        keys = {key.decode() for tag_keys in members for key in tag_keys}
+    if keys:
+        cache.delete_many(*keys)
+        _evict_local(sorted(keys))
+    return len(keys)
 
 def clear_all_cache():
     """Clear all cache entries"""
-    cache.clear() 
\ No newline at end of file
+    cache.clear()
+    _evict_local('*')
@@ -0,0 +1,53 @@
+from functools import wraps
+from flask import request, current_app, g
+import hashlib
+import json
+
+def make_etag(*parts):
+    """Hash the given version parts into a strong ETag value"""
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()
+
+def conditional(version_func):
+    """Answer If-None-Match with 304 when the resource version hasn't changed.
+
+    `version_func` receives the view arguments and returns a cheap-to-compute
+    version (e.g. an updated_at timestamp), or None if the resource doesn't
+    exist. The ETag also covers the path and query string, so each
+    representation of a resource gets its own tag.
+
+    Over a cached() view the version is only looked up when the cache
+    recomputes the response: the ETag is stored with the cached entry and
+    hits are revalidated against it without touching the database.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            def current_etag():
+                version = version_func(*args, **kwargs)
+                if version is None:
+                    return None
+                return make_etag(request.path, sorted(request.args.items(multi=True)), version)
+
+            if getattr(f, 'stores_etag', False):
+                # cached() calls current_etag() before each recompute and serves the result on hits
+                g.etag_func = current_etag
+                response = current_app.make_response(f(*args, **kwargs))
+                etag = response.get_etag()[0]
+            else:
+                etag = current_etag()
+                if etag is not None and request.if_none_match.contains_weak(etag):
+                    return not_modified(etag)
+                response = current_app.make_response(f(*args, **kwargs))
+                if etag is not None and response.status_code == 200:
+                    response.set_etag(etag)
+
+            if etag is not None and response.status_code == 200 and request.if_none_match.contains_weak(etag):
+                return not_modified(etag)
+            return response
+        return decorated_function
+    return decorator
+
+def not_modified(etag):
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    return response
@@ -0,0 +1,178 @@
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class LocalCache:
+    """Size-bounded LRU with per-entry TTL, shared by the threads of one worker process"""
+
+    def __init__(self, max_items=1024, ttl=30):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._items = OrderedDict()  # key -> (expires at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store `value`, never for longer than the tier's own TTL"""
+        ttl = min(ttl, self.ttl) if ttl else self.ttl
+        with self._lock:
+            self._items[key] = (time.monotonic() + ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+class CacheStats:
+    """Hit and miss counts per cache tier, plus stale-while-revalidate counts, for one worker process"""
+
+    TIERS = ('l1', 'l2')
+    REVALIDATION_EVENTS = ('fresh', 'stale', 'refreshed', 'refresh_failed', 'refresh_rejected')
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, tier, hit):
+        with self._lock:
+            self._counts[tier, hit] += 1
+
+    def incr(self, event):
+        with self._lock:
+            self._counts[event] += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+        report = {}
+        for tier in self.TIERS:
+            hits, misses = counts.get((tier, True), 0), counts.get((tier, False), 0)
+            report[tier] = {
+                'hits': hits,
+                'misses': misses,
+                'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None
+            }
+        report['revalidation'] = {event: counts.get(event, 0) for event in self.REVALIDATION_EVENTS}
+        return report
+
+class RefreshPool:
+    """Bounded thread pool running a worker's background cache refreshes.
+
+    At most `max_pending` refreshes are queued or running at once; submit()
+    returns False instead of waiting when the pool is full. A key already
+    queued or being refreshed is not queued again.
+    """
+
+    def __init__(self, workers=4, max_pending=32):
+        self.pid = os.getpid()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cache-refresh')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn):
+        with self._lock:
+            if key in self._pending:
+                return True
+            if not self._slots.acquire(blocking=False):
+                return False
+            self._pending.add(key)
+        try:
+            future = self._executor.submit(fn)
+        except RuntimeError:  # shut down
+            self._done(key)
+            return False
+        future.add_done_callback(lambda _: self._done(key))
+        return True
+
+    def _done(self, key):
+        with self._lock:
+            self._pending.discard(key)
+            self._slots.release()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+class Subscription:
+    """A background thread handing each JSON message published on a Redis channel to `handler`"""
+
+    def __init__(self, client, channel, handler, poll_interval=0.1):
+        self.channel = channel
+        self._handler = handler
+        self._pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{channel: self._on_message})
+        self._thread = self._pubsub.run_in_thread(
+            sleep_time=poll_interval, daemon=True, exception_handler=self._on_error
+        )
+
+    def _on_message(self, message):
+        try:
+            data = json.loads(message['data'])
+        except (TypeError, ValueError):
+            logger.warning('Ignoring malformed message on %s', self.channel)
+            return
+        self._handler(data)
+
+    def _on_error(self, error, pubsub, thread):
+        # Keep listening: the pubsub reconnects and resubscribes on its next read
+        logger.warning('Error reading %s: %s', self.channel, error)
+        time.sleep(thread.sleep_time)
+
+    def stop(self, timeout=1.0):
+        """Stop the listener thread, wait for it to exit and release its connection"""
+        self._thread.stop()
+        self._thread.join(timeout)
+        self._pubsub.close()
+
+class LocalTier:
+    """A process's L1 cache plus the pub/sub listener that keeps it in step with other workers.
+
+    Invalidations arrive on `channel` as a JSON list of keys, or "*" to drop
+    everything; see app.utils.cache.invalidate_tags().
+    """
+
+    def __init__(self, client, channel, max_items, ttl):
+        self.pid = os.getpid()
+        self.cache = LocalCache(max_items=max_items, ttl=ttl)
+        self.channel = channel
+        self._listener = Subscription(client, channel, self.evict) if client is not None else None
+
+    def evict(self, keys):
+        """Drop `keys`, or everything when given '*'"""
+        if keys == '*':
+            self.cache.clear()
+        else:
+            self.cache.delete_many(keys)
+
+    def stop(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
@@ -0,0 +1,59 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from sqlalchemy import tuple_
+
+def _to_json(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+def _from_json(column, value):
+    python_type = column.type.python_type
+    if value is None:
+        return None
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return python_type(value)
+
+def encode_cursor(sort, values):
+    """Encode the sort key of the last row on a page as an opaque cursor"""
+    payload = json.dumps({'s': sort, 'v': [_to_json(v) for v in values]}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, sort, columns):
+    """Decode a cursor produced by encode_cursor, raising ValueError if it doesn't fit `sort`"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if payload['s'] != sort or len(payload['v']) != len(columns):
+            raise ValueError('Cursor does not match sort order')
+        return [_from_json(column, value) for column, value in zip(columns, payload['v'])]
+    except (KeyError, TypeError, ValueError, ArithmeticError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def keyset_paginate(query, columns, sort, cursor=None, per_page=10, descending=False):
+    """Fetch one page of `query` ordered by `columns`, seeking past `cursor` instead of using OFFSET.
+
+    The last column must be unique (usually the primary key) so the order is stable.
+    Returns the page items and the cursor for the next page, or None on the last page.
+    """
+    if cursor:
+        key = tuple_(*columns)
+        after = tuple_(*decode_cursor(cursor, sort, columns))
+        query = query.filter(key < after if descending else key > after)
+
+    query = query.order_by(*(column.desc() if descending else column.asc() for column in columns))
+    items = query.limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        last = items[-1]
+        next_cursor = encode_cursor(sort, [getattr(last, column.key) for column in columns])
+    return items, next_cursor
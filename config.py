@@ -25,4 +25,48 @@ class Config:
 
     # Stripe Configuration
     STRIPE_PUBLIC_KEY = os.environ.get('STRIPE_PUBLIC_KEY')
-    STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
\ No newline at end of file
+    STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
+
+    # Search backend: 'postgresql', 'sqlite' or 'like' (defaults to the database dialect)
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND')
+
+    # Maximum number of ids accepted by /books/batch
+    BOOK_BATCH_MAX_IDS = int(os.environ.get('BOOK_BATCH_MAX_IDS', 100))
+
+    # Upper bounds of the price ranges reported by /books/facets
+    FACET_PRICE_EDGES = [10, 20, 50, 100]
+
+    # Number of newest reviews embedded in /books/<id>
+    BOOK_DETAIL_REVIEWS = int(os.environ.get('BOOK_DETAIL_REVIEWS', 5))
+
+    # Prepended to every cache key, so several apps or environments can share one Redis
+    CACHE_KEY_PREFIX = os.environ.get('CACHE_KEY_PREFIX', 'booknook:')
+
+    # Lifetime of the Redis sets tracking which cache keys carry each tag; must
+    # outlive the longest cached() timeout
+    CACHE_TAG_TTL = int(os.environ.get('CACHE_TAG_TTL', 24 * 60 * 60))
+
+    # Optional per-worker in-process cache in front of Redis for views marked
+    # cached(local=True); entries live at most CACHE_L1_TTL seconds
+    CACHE_L1_ENABLED = os.environ.get('CACHE_L1_ENABLED', '').lower() in ('1', 'true', 'yes')
+    CACHE_L1_MAX_ITEMS = int(os.environ.get('CACHE_L1_MAX_ITEMS', 1024))
+    CACHE_L1_TTL = int(os.environ.get('CACHE_L1_TTL', 30))
+
+    # Single-flight recomputation of missed cache entries: the lock's lifetime
+    # (longer than the slowest cached view), how long other workers wait for
+    # its holder, and how often they poll
+    CACHE_LOCK_TIMEOUT = float(os.environ.get('CACHE_LOCK_TIMEOUT', 10))
+    CACHE_LOCK_WAIT = float(os.environ.get('CACHE_LOCK_WAIT', 5))
+    CACHE_LOCK_POLL_INTERVAL = float(os.environ.get('CACHE_LOCK_POLL_INTERVAL', 0.05))
+
+    # Background refreshes of entries served stale by cached(stale_ttl=...):
+    # threads per worker, and how many may be queued or running at once
+    CACHE_REFRESH_WORKERS = int(os.environ.get('CACHE_REFRESH_WORKERS', 4))
+    CACHE_REFRESH_MAX_PENDING = int(os.environ.get('CACHE_REFRESH_MAX_PENDING', 32))
+
+    # Cached response bodies of at least this many bytes are stored compressed,
+    # with gzip or, when CACHE_COMPRESSION is 'lz4' and lz4 is installed, lz4.
+    # gzip bodies are sent as is to clients accepting gzip if CACHE_SERVE_GZIP is on
+    CACHE_COMPRESS_MIN_BYTES = int(os.environ.get('CACHE_COMPRESS_MIN_BYTES', 1024))
+    CACHE_COMPRESSION = os.environ.get('CACHE_COMPRESSION', 'gzip')
+    CACHE_SERVE_GZIP = os.environ.get('CACHE_SERVE_GZIP', 'true').lower() in ('1', 'true', 'yes')
@@ -45,6 +45,21 @@ target_db = current_app.extensions['migrate'].db
 # ... etc.
 
 
+# Search structures created by raw DDL in app/books/search.py (the SQLite
+# FTS5 table and its shadow tables, the PostgreSQL GIN expression index);
+# they have no model, so autogenerate must not propose dropping them
+UNMANAGED_TABLE_PREFIX = 'books_fts'
+UNMANAGED_INDEXES = {'ix_books_search'}
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    if type_ == 'table' and name.startswith(UNMANAGED_TABLE_PREFIX):
+        return False
+    if type_ == 'index' and name in UNMANAGED_INDEXES:
+        return False
+    return True
+
+
 def get_metadata():
     if hasattr(target_db, 'metadatas'):
         return target_db.metadatas[None]
@@ -65,7 +80,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_object=include_object
     )
 
     with context.begin_transaction():
@@ -93,6 +109,7 @@ def run_migrations_online():
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    conf_args.setdefault("include_object", include_object)
 
     connectable = get_engine()
 
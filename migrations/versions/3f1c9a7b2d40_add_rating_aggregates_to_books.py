@@ -0,0 +1,35 @@
+"""Add rating aggregates to books
+
+Revision ID: 3f1c9a7b2d40
+Revises: ed30d4d3ecb8
+Create Date: 2025-04-02 11:12:43.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7b2d40'
+down_revision = 'ed30d4d3ecb8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rating_count', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('rating_sum', sa.Integer(), nullable=False, server_default='0'))
+
+    # Backfill from existing reviews
+    op.execute("""
+        UPDATE books SET
+            rating_count = (SELECT COUNT(*) FROM reviews WHERE reviews.book_id = books.id),
+            rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews WHERE reviews.book_id = books.id)
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.drop_column('rating_sum')
+        batch_op.drop_column('rating_count')
@@ -0,0 +1,25 @@
+"""Add indexes for review sort orders
+
+Revision ID: 4c8e2a7f9b13
+Revises: 7e93b1d5c428
+Create Date: 2025-04-17 10:22:08.615204
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '4c8e2a7f9b13'
+down_revision = '7e93b1d5c428'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_reviews_book_id_rating_created_at', 'reviews', ['book_id', 'rating', 'created_at'], unique=False)
+    op.create_index('ix_reviews_user_id_created_at', 'reviews', ['user_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_reviews_user_id_created_at', table_name='reviews')
+    op.drop_index('ix_reviews_book_id_rating_created_at', table_name='reviews')
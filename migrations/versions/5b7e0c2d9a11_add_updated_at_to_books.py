@@ -0,0 +1,30 @@
+"""Add updated_at to books
+
+Revision ID: 5b7e0c2d9a11
+Revises: a84d2e6f1c93
+Create Date: 2025-04-09 09:21:37.640118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e0c2d9a11'
+down_revision = 'a84d2e6f1c93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_books_updated_at'), ['updated_at'], unique=False)
+
+    op.execute("UPDATE books SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)")
+
+
+def downgrade():
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_books_updated_at'))
+        batch_op.drop_column('updated_at')
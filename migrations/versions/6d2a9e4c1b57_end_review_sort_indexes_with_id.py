@@ -0,0 +1,34 @@
+"""End review sort indexes with id
+
+Revision ID: 6d2a9e4c1b57
+Revises: f2b85a6d3c71
+Create Date: 2025-04-28 09:14:37.502918
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '6d2a9e4c1b57'
+down_revision = 'f2b85a6d3c71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Review listings break ties on id; without it in the index PostgreSQL adds an incremental sort
+    op.create_index('ix_reviews_book_id_created_at_id', 'reviews', ['book_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_reviews_book_id_rating_created_at_id', 'reviews', ['book_id', 'rating', 'created_at', 'id'], unique=False)
+    op.create_index('ix_reviews_user_id_created_at_id', 'reviews', ['user_id', 'created_at', 'id'], unique=False)
+    op.drop_index('ix_reviews_book_id_created_at', table_name='reviews')
+    op.drop_index('ix_reviews_book_id_rating_created_at', table_name='reviews')
+    op.drop_index('ix_reviews_user_id_created_at', table_name='reviews')
+
+
+def downgrade():
+    op.create_index('ix_reviews_user_id_created_at', 'reviews', ['user_id', 'created_at'], unique=False)
+    op.create_index('ix_reviews_book_id_rating_created_at', 'reviews', ['book_id', 'rating', 'created_at'], unique=False)
+    op.create_index('ix_reviews_book_id_created_at', 'reviews', ['book_id', 'created_at'], unique=False)
+    op.drop_index('ix_reviews_user_id_created_at_id', table_name='reviews')
+    op.drop_index('ix_reviews_book_id_rating_created_at_id', table_name='reviews')
+    op.drop_index('ix_reviews_book_id_created_at_id', table_name='reviews')
@@ -0,0 +1,49 @@
+"""Add book recommendation tables
+
+Revision ID: 7e93b1d5c428
+Revises: d2c4f8a61e07
+Create Date: 2025-04-18 10:47:03.284519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e93b1d5c428'
+down_revision = 'd2c4f8a61e07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('book_cooccurrences',
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('related_book_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['related_book_id'], ['books.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('book_id', 'related_book_id')
+    )
+    op.create_table('book_recommendations',
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('related_book_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['related_book_id'], ['books.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('book_id', 'related_book_id')
+    )
+    op.create_table('recommendation_runs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('last_order_id', sa.Integer(), nullable=False),
+    sa.Column('order_items', sa.Integer(), nullable=False),
+    sa.Column('books_updated', sa.Integer(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('recommendation_runs')
+    op.drop_table('book_recommendations')
+    op.drop_table('book_cooccurrences')
@@ -0,0 +1,42 @@
+"""Add purchased_books entitlement table
+
+Revision ID: 9a3f6d1e8c52
+Revises: 4c8e2a7f9b13
+Create Date: 2025-04-18 16:31:44.902187
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a3f6d1e8c52'
+down_revision = '4c8e2a7f9b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('purchased_books',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('purchased_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['order_id'], ['orders.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'book_id')
+    )
+
+    # Backfill from order history; the status enum is stored by name
+    op.execute("""
+        INSERT INTO purchased_books (user_id, book_id, order_id, purchased_at)
+        SELECT orders.user_id, order_items.book_id, MIN(orders.id), MIN(orders.order_date)
+        FROM orders JOIN order_items ON order_items.order_id = orders.id
+        WHERE orders.status = 'COMPLETED'
+        GROUP BY orders.user_id, order_items.book_id
+    """)
+
+
+def downgrade():
+    op.drop_table('purchased_books')
@@ -0,0 +1,63 @@
+"""Add full-text search index for books
+
+Revision ID: a84d2e6f1c93
+Revises: 3f1c9a7b2d40
+Create Date: 2025-04-06 16:40:12.902215
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a84d2e6f1c93'
+down_revision = '3f1c9a7b2d40'
+branch_labels = None
+depends_on = None
+
+# Must stay identical to app.books.search.PG_SEARCH_VECTOR for the index to be used
+PG_SEARCH_VECTOR = (
+    "to_tsvector('english', coalesce(books.title, '') || ' ' || "
+    "coalesce(books.author, '') || ' ' || coalesce(books.description, ''))"
+)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        op.execute(f"CREATE INDEX ix_books_search ON books USING gin ({PG_SEARCH_VECTOR})")
+    elif dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE books_fts USING fts5("
+            "title, author, description, content='books', content_rowid='id')"
+        )
+        op.execute(
+            "CREATE TRIGGER books_fts_ai AFTER INSERT ON books BEGIN "
+            "INSERT INTO books_fts(rowid, title, author, description) "
+            "VALUES (new.id, new.title, new.author, new.description); END"
+        )
+        op.execute(
+            "CREATE TRIGGER books_fts_ad AFTER DELETE ON books BEGIN "
+            "INSERT INTO books_fts(books_fts, rowid, title, author, description) "
+            "VALUES ('delete', old.id, old.title, old.author, old.description); END"
+        )
+        op.execute(
+            "CREATE TRIGGER books_fts_au AFTER UPDATE ON books BEGIN "
+            "INSERT INTO books_fts(books_fts, rowid, title, author, description) "
+            "VALUES ('delete', old.id, old.title, old.author, old.description); "
+            "INSERT INTO books_fts(rowid, title, author, description) "
+            "VALUES (new.id, new.title, new.author, new.description); END"
+        )
+        op.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_books_search")
+    elif dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS books_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS books_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS books_fts_ai")
+        op.execute("DROP TABLE IF EXISTS books_fts")
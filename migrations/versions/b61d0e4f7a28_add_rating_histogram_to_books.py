@@ -0,0 +1,37 @@
+"""Add rating histogram to books
+
+Revision ID: b61d0e4f7a28
+Revises: 9a3f6d1e8c52
+Create Date: 2025-04-21 09:14:37.550921
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b61d0e4f7a28'
+down_revision = '9a3f6d1e8c52'
+branch_labels = None
+depends_on = None
+
+STARS = range(1, 6)
+
+
+def upgrade():
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        for star in STARS:
+            batch_op.add_column(sa.Column(f'rating_{star}_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # Backfill from existing reviews
+    op.execute("UPDATE books SET " + ", ".join(
+        f"rating_{star}_count = (SELECT COUNT(*) FROM reviews "
+        f"WHERE reviews.book_id = books.id AND reviews.rating = {star})"
+        for star in STARS
+    ))
+
+
+def downgrade():
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        for star in reversed(STARS):
+            batch_op.drop_column(f'rating_{star}_count')
@@ -0,0 +1,54 @@
+"""Add indexes for hot lookups
+
+Revision ID: d2c4f8a61e07
+Revises: 5b7e0c2d9a11
+Create Date: 2025-04-14 13:05:52.417730
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2c4f8a61e07'
+down_revision = '5b7e0c2d9a11'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_books_category', 'books', ['category'], unique=False)
+    op.create_index('ix_books_price', 'books', ['price'], unique=False)
+    op.create_index('ix_reviews_book_id_created_at', 'reviews', ['book_id', 'created_at'], unique=False)
+    op.create_index('ix_reviews_user_id_book_id', 'reviews', ['user_id', 'book_id'], unique=False)
+    op.create_index('ix_carts_user_id', 'carts', ['user_id'], unique=False)
+    op.create_index('ix_orders_user_id_order_date', 'orders', ['user_id', 'order_date'], unique=False)
+    op.create_index('ix_orders_status_order_date', 'orders', ['status', 'order_date'], unique=False)
+    op.create_index('ix_order_items_order_id', 'order_items', ['order_id'], unique=False)
+    op.create_index('ix_order_items_book_id', 'order_items', ['book_id'], unique=False)
+
+    # Merge duplicate cart lines into the oldest one before enforcing uniqueness
+    op.execute("""
+        UPDATE cart_items SET quantity = (
+            SELECT SUM(other.quantity) FROM cart_items AS other
+            WHERE other.cart_id = cart_items.cart_id AND other.book_id = cart_items.book_id
+        )
+        WHERE id IN (SELECT MIN(id) FROM cart_items GROUP BY cart_id, book_id HAVING COUNT(*) > 1)
+    """)
+    op.execute("""
+        DELETE FROM cart_items
+        WHERE id NOT IN (SELECT MIN(id) FROM cart_items GROUP BY cart_id, book_id)
+    """)
+    op.create_index('uq_cart_items_cart_id_book_id', 'cart_items', ['cart_id', 'book_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_cart_items_cart_id_book_id', table_name='cart_items')
+    op.drop_index('ix_order_items_book_id', table_name='order_items')
+    op.drop_index('ix_order_items_order_id', table_name='order_items')
+    op.drop_index('ix_orders_status_order_date', table_name='orders')
+    op.drop_index('ix_orders_user_id_order_date', table_name='orders')
+    op.drop_index('ix_carts_user_id', table_name='carts')
+    op.drop_index('ix_reviews_user_id_book_id', table_name='reviews')
+    op.drop_index('ix_reviews_book_id_created_at', table_name='reviews')
+    op.drop_index('ix_books_price', table_name='books')
+    op.drop_index('ix_books_category', table_name='books')
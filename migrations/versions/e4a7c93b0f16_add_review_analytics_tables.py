@@ -0,0 +1,48 @@
+"""Add review analytics tables
+
+Revision ID: e4a7c93b0f16
+Revises: b61d0e4f7a28
+Create Date: 2025-04-22 15:08:26.731044
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a7c93b0f16'
+down_revision = 'b61d0e4f7a28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('review_analyses',
+    sa.Column('review_id', sa.Integer(), nullable=False),
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('review_updated_at', sa.DateTime(), nullable=True),
+    sa.Column('sentiment', sa.Float(), nullable=False),
+    sa.Column('terms', sa.JSON(), nullable=False),
+    sa.ForeignKeyConstraint(['review_id'], ['reviews.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('review_id')
+    )
+    op.create_index('ix_review_analyses_book_id', 'review_analyses', ['book_id'], unique=False)
+    op.create_table('book_review_summaries',
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('review_count', sa.Integer(), nullable=False),
+    sa.Column('average_sentiment', sa.Float(), nullable=True),
+    sa.Column('positive_count', sa.Integer(), nullable=False),
+    sa.Column('neutral_count', sa.Integer(), nullable=False),
+    sa.Column('negative_count', sa.Integer(), nullable=False),
+    sa.Column('keywords', sa.JSON(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('book_id')
+    )
+
+
+def downgrade():
+    op.drop_table('book_review_summaries')
+    op.drop_index('ix_review_analyses_book_id', table_name='review_analyses')
+    op.drop_table('review_analyses')
@@ -0,0 +1,26 @@
+"""Add is_hidden to reviews
+
+Revision ID: f2b85a6d3c71
+Revises: e4a7c93b0f16
+Create Date: 2025-04-23 11:40:12.084376
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b85a6d3c71'
+down_revision = 'e4a7c93b0f16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('is_hidden', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade():
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.drop_column('is_hidden')
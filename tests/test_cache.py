@@ -1,20 +1,33 @@
 import pytest
+from contextlib import contextmanager
+from flask import request
+from sqlalchemy import event
+from flask_jwt_extended import create_access_token
 from app import create_app, db
-from app.models import Book, Review, User
-from app.utils.cache import cache, clear_all_cache
+from app.models import Book, Review, User, Order, OrderItem, OrderStatusEnum, PurchasedBook
+from app.utils.cache import (
+    cache, cached, cache_stats, clear_all_cache, invalidate_tags, generate_cache_key, _acquire_lock, _release_lock
+)
+from concurrent.futures import ThreadPoolExecutor
 from config import Config
 from datetime import datetime
+import gzip
 import json
+import time
 
 class TestConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     CACHE_TYPE = 'simple'  
     CACHE_ENABLED = True
+    # These tests warm every cached view many times over
+    RATELIMIT_ENABLED = False
 
-@pytest.fixture
-def app():
-    app = create_app(TestConfig)
+@pytest.fixture(params=['simple', 'RedisCache'])
+def app(request):
+    # Every test runs against both the in-process and the Redis backend
+    config = type('BackendTestConfig', (TestConfig,), {'CACHE_TYPE': request.param})
+    app = create_app(config)
     with app.app_context():
         db.create_all()
         clear_all_cache()
@@ -54,14 +67,18 @@ def sample_user():
     db.session.commit()
     return user
 
+def write_behind_cache(book, **values):
+    """Change a book without moving its updated_at (the ETag version), so only the cache hides it"""
+    db.session.execute(db.update(Book).where(Book.id == book.id).values(updated_at=Book.updated_at, **values))
+    db.session.commit()
+
 def test_list_books_cache(client, sample_book):
     clear_all_cache()
     response1 = client.get('/books/list')
     assert response1.status_code == 200
     data1 = json.loads(response1.data)
 
-    sample_book.price = 19.99
-    db.session.commit()
+    write_behind_cache(sample_book, price=19.99)
 
     response2 = client.get('/books/list')
     assert response2.status_code == 200
@@ -75,8 +92,7 @@ def test_get_book_cache(client, sample_book):
     assert response1.status_code == 200
     data1 = json.loads(response1.data)
 
-    sample_book.title = "Updated Title"
-    db.session.commit()
+    write_behind_cache(sample_book, title="Updated Title")
 
     response2 = client.get(f'/books/{sample_book.id}')
     assert response2.status_code == 200
@@ -85,6 +101,37 @@ def test_get_book_cache(client, sample_book):
     assert data1 == data2
     assert data2['title'] == "Test Book"
 
+@contextmanager
+def count_queries():
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+def test_cached_entries_carry_their_etag(client, sample_book):
+    """Hits are served and revalidated under the stored ETag without touching the database"""
+    first = client.get('/books/list')
+    sample_book.stock = 4
+    db.session.commit()
+
+    with count_queries() as statements:
+        second = client.get('/books/list')
+        not_modified = client.get('/books/list', headers={'If-None-Match': first.headers['ETag']})
+    assert statements == []
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert second.json == first.json
+    assert not_modified.status_code == 304
+
+    invalidate_tags('catalog')
+    third = client.get('/books/list', headers={'If-None-Match': first.headers['ETag']})
+    assert third.status_code == 200
+    assert third.headers['ETag'] != first.headers['ETag']
+    assert third.json['books'][0]['stock'] == 4
+
 def test_search_book_cache(client, sample_book):
     response1 = client.get('/books/search?q=Test')
     assert response1.status_code == 200
@@ -105,16 +152,7 @@ def test_categories_cache(client, sample_book):
     assert response1.status_code == 200
     data1 = json.loads(response1.data)
 
-    new_book = Book(
-        isbn="0987654321",
-        title="Another Book",
-        author="Another Author",
-        price=14.99,
-        stock=5,
-        category="New Category"
-    )
-    db.session.add(new_book)
-    db.session.commit()
+    write_behind_cache(sample_book, category="New Category")
 
     response2 = client.get('/books/categories')
     assert response2.status_code == 200
@@ -169,4 +207,264 @@ def test_cache_invalidation(client, sample_book):
     data2 = json.loads(response2.data)
 
     assert data1 != data2
-    assert data2['title'] == "Updated Title" 
\ No newline at end of file
+    assert data2['title'] == "Updated Title"
+
+def cached_namespaces():
+    """Namespaces of the entries currently cached, i.e. each key minus prefix and hash"""
+    backend = cache.cache
+    client = getattr(backend, '_write_client', None)
+    if client is None:
+        keys = list(backend._cache)
+    else:
+        prefix = backend.key_prefix
+        keys = [key.decode()[len(prefix):] for key in client.scan_iter(match=prefix + '*')]
+    return {key.rsplit(':', 1)[0] for key in keys if not key.startswith('tag:')}
+
+def warm_cache(client, ids, headers):
+    for url in ['/books/list', '/books/search?q=Book', '/books/categories', '/books/facets',
+                f'/books/{ids["a"]}', f'/books/{ids["b"]}',
+                f'/api/books/{ids["a"]}/reviews', f'/api/books/{ids["b"]}/reviews']:
+        assert client.get(url).status_code == 200
+    for user in ('u1', 'u2'):
+        assert client.get('/api/users/reviews', headers=headers[user]).status_code == 200
+
+@pytest.fixture
+def primed(client, sample_book, sample_user):
+    """Two books, two reviewers and every cached view warmed; returns ids, headers and namespaces"""
+    other_book = Book(isbn="5555555555", title="Other Book", author="Other Author", price=5,
+        stock=3, category="Test Category")
+    other_user = User(email="other@example.com", username="other")
+    db.session.add_all([other_book, other_user])
+    db.session.flush()
+    order = Order(user_id=sample_user.id, total_amount=sample_book.price, shipping_address="Somewhere",
+        status=OrderStatusEnum.COMPLETED)
+    db.session.add(order)
+    db.session.flush()
+    db.session.add(OrderItem(order_id=order.id, book_id=sample_book.id, quantity=1,
+        price_at_time=sample_book.price))
+    db.session.add(PurchasedBook(user_id=sample_user.id, book_id=sample_book.id, order_id=order.id))
+    db.session.add(Review(user_id=other_user.id, book_id=other_book.id, rating=2, comment="Meh"))
+    db.session.commit()
+
+    ids = {'a': sample_book.id, 'b': other_book.id, 'u1': sample_user.id, 'u2': other_user.id}
+    headers = {
+        user: {'Authorization': f'Bearer {create_access_token(identity=str(ids[user]))}'}
+        for user in ('u1', 'u2')
+    }
+    warm_cache(client, ids, headers)
+    return ids, headers, cached_namespaces()
+
+def test_cache_keys_are_namespaced(client, primed):
+    ids, headers, namespaces = primed
+    assert namespaces == {
+        'books_list', 'books_search', 'books_categories', 'books_facets',
+        f'book_{ids["a"]}', f'book_{ids["b"]}', f'book_{ids["a"]}_reviews', f'book_{ids["b"]}_reviews',
+        f'user_reviews:{ids["u1"]}', f'user_reviews:{ids["u2"]}'
+    }
+    # Each user gets their own entry rather than whoever warmed the cache first
+    assert client.get('/api/users/reviews', headers=headers['u1']).json == []
+    assert [r['comment'] for r in client.get('/api/users/reviews', headers=headers['u2']).json] == ['Meh']
+
+def test_book_update_evicts_catalog_and_book(client, primed, admin_header):
+    ids, _, namespaces = primed
+    assert client.put(f'/admin/books/{ids["a"]}', json={'price': 12}, headers=admin_header).status_code == 200
+    assert namespaces - cached_namespaces() == {
+        'books_list', 'books_search', 'books_categories', 'books_facets', f'book_{ids["a"]}'
+    }
+
+def test_book_delete_also_evicts_its_reviews(client, primed, admin_header):
+    # The primed books have orders and reviews referencing them, so delete a fresh one
+    book = Book(isbn="7777777777", title="Unsold Book", author="Nobody", price=3, stock=1,
+        category="Test Category")
+    db.session.add(book)
+    db.session.commit()
+    for url in (f'/books/{book.id}', f'/api/books/{book.id}/reviews'):
+        assert client.get(url).status_code == 200
+    namespaces = cached_namespaces()
+
+    assert client.delete(f'/admin/books/{book.id}', headers=admin_header).status_code == 200
+    assert namespaces - cached_namespaces() == {
+        'books_list', 'books_search', 'books_categories', 'books_facets',
+        f'book_{book.id}', f'book_{book.id}_reviews'
+    }
+
+def test_review_writes_evict_book_and_author(client, primed):
+    ids, headers, namespaces = primed
+    expected = {
+        'books_list', 'books_search', 'books_facets',
+        f'book_{ids["a"]}', f'book_{ids["a"]}_reviews', f'user_reviews:{ids["u1"]}'
+    }
+    response = client.post(f'/api/books/{ids["a"]}/reviews', json={'rating': 5, 'comment': 'Great'},
+        headers=headers['u1'])
+    assert response.status_code == 201
+    assert namespaces - cached_namespaces() == expected
+
+    review_id = response.json['id']
+    for method, json_body in (('put', {'rating': 4, 'comment': 'Good'}), ('delete', None)):
+        clear_all_cache()
+        warm_cache(client, ids, headers)
+        response = getattr(client, method)(f'/api/reviews/{review_id}', json=json_body, headers=headers['u1'])
+        assert response.status_code == 200
+        assert namespaces - cached_namespaces() == expected
+
+def test_bulk_moderation_evicts_affected_books_and_authors(client, primed, admin_header):
+    ids, _, namespaces = primed
+    response = client.post('/admin/reviews/moderate', json={'action': 'hide', 'user_id': ids['u2']},
+        headers=admin_header)
+    assert response.status_code == 200
+    assert namespaces - cached_namespaces() == {
+        'books_list', 'books_search', 'books_facets',
+        f'book_{ids["b"]}', f'book_{ids["b"]}_reviews', f'user_reviews:{ids["u2"]}'
+    }
+
+
+@pytest.fixture
+def l1_app():
+    config = type('L1TestConfig', (TestConfig,), {'CACHE_TYPE': 'RedisCache', 'CACHE_L1_ENABLED': True})
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+        clear_all_cache()
+        yield app
+        db.session.remove()
+        db.drop_all()
+        if 'cache_l1' in app.extensions:
+            app.extensions['cache_l1'].stop()
+
+def l1_size(app):
+    return len(app.extensions['cache_l1'].cache) if 'cache_l1' in app.extensions else 0
+
+def test_l1_serves_hot_book_pages_in_process(l1_app, sample_book):
+    admin = User(email="admin@example.com", username="admin", is_admin=True)
+    db.session.add(admin)
+    db.session.commit()
+    admin_header = {'Authorization': f'Bearer {create_access_token(identity=str(admin.id))}'}
+    client = l1_app.test_client()
+    for _ in range(3):
+        assert client.get(f'/books/{sample_book.id}').json['title'] == 'Test Book'
+    stats = client.get('/admin/cache/stats', headers=admin_header).json
+    assert stats['l1']['enabled'] and stats['l1']['size'] == 1
+    assert (stats['l1']['hits'], stats['l1']['misses']) == (2, 1)
+    # Only the first request went to Redis
+    assert (stats['l2']['hits'], stats['l2']['misses']) == (0, 1)
+
+    assert client.put(f'/admin/books/{sample_book.id}', json={'title': 'New Title'},
+        headers=admin_header).status_code == 200
+    assert client.get(f'/books/{sample_book.id}').json['title'] == 'New Title'
+
+def test_l1_hits_run_no_queries(l1_app, sample_book):
+    client = l1_app.test_client()
+    for url in (f'/books/{sample_book.id}', '/books/categories'):
+        etag = client.get(url).headers['ETag']
+        with count_queries() as statements:
+            assert client.get(url).status_code == 200
+            assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+        assert statements == []
+    stats = cache_stats()
+    assert (stats['l1']['hits'], stats['l2']['hits']) == (4, 0)
+
+def test_l1_invalidation_reaches_other_workers(l1_app, sample_book):
+    assert l1_app.test_client().get('/books/categories').status_code == 200
+    assert l1_size(l1_app) == 1
+
+    # Another worker sharing the Redis instance invalidates the catalog
+    other = create_app(type('OtherWorkerConfig', (TestConfig,), {
+        'CACHE_TYPE': 'RedisCache', 'CACHE_L1_ENABLED': True
+    }))
+    with other.app_context():
+        assert invalidate_tags('catalog') == 1
+
+    deadline = time.monotonic() + 5
+    while l1_size(l1_app) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert l1_size(l1_app) == 0
+
+@pytest.fixture
+def redis_app():
+    app = create_app(type('RedisTestConfig', (TestConfig,), {'CACHE_TYPE': 'RedisCache'}))
+    with app.app_context():
+        clear_all_cache()
+        yield app
+
+def test_concurrent_misses_recompute_once(redis_app):
+    calls = []
+
+    @cached(timeout=60, namespace='slow')
+    def slow_view():
+        calls.append(1)
+        time.sleep(0.3)
+        return {'value': len(calls)}
+
+    def get(_):
+        with redis_app.test_request_context('/slow'):
+            return slow_view().json
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(get, range(8)))
+    assert len(calls) == 1
+    assert results == [{'value': 1}] * 8
+
+def test_early_refresh_runs_only_in_the_lock_holder(redis_app, monkeypatch):
+    calls = []
+
+    @cached(timeout=60, namespace='hot', xfetch_beta=1.0)
+    def hot_view():
+        calls.append(1)
+        return {'value': len(calls)}
+
+    with redis_app.test_request_context('/hot'):
+        assert hot_view().json == {'value': 1}
+        monkeypatch.setattr('app.utils.cache._expires_early', lambda *args: True)
+
+        # Another worker is already refreshing, so the current value is served
+        client, key = cache.cache._write_client, generate_cache_key('hot')
+        token = _acquire_lock(client, key)
+        assert hot_view().json == {'value': 1}
+        _release_lock(client, key, token)
+
+        assert hot_view().json == {'value': 2}
+        assert len(calls) == 2
+
+def test_stale_entries_are_served_while_refreshing_in_background(redis_app):
+    calls = []
+
+    @cached(timeout=1, namespace='catalog_page', stale_ttl=60)
+    def catalog_page():
+        calls.append(1)
+        return {'value': len(calls), 'page': request.args.get('page')}
+
+    with redis_app.test_request_context('/catalog?page=2'):
+        assert catalog_page().json == {'value': 1, 'page': '2'}
+        key = generate_cache_key('catalog_page')
+        time.sleep(1.1)
+        # Served immediately from the expired entry; the refresh replays the request off-thread
+        assert catalog_page().json == {'value': 1, 'page': '2'}
+
+        deadline = time.monotonic() + 5
+        while json.loads(cache.get(key)[0][1])['value'] == 1 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert catalog_page().json == {'value': 2, 'page': '2'}
+        assert cache_stats()['revalidation'] == {
+            'fresh': 1, 'stale': 1, 'refreshed': 1, 'refresh_failed': 0, 'refresh_rejected': 0
+        }
+
+def test_large_responses_are_cached_compressed(client, sample_book):
+    client.application.config['CACHE_COMPRESS_MIN_BYTES'] = 100
+    plain = client.get('/books/list')
+    zipped = client.get('/books/list', headers={'Accept-Encoding': 'gzip'})
+    assert plain.content_encoding is None and zipped.content_encoding == 'gzip'
+    assert json.loads(gzip.decompress(zipped.data)) == plain.json
+    assert 'Accept-Encoding' in zipped.vary
+
+    # Each encoding is its own representation for revalidation
+    assert zipped.get_etag()[0] == plain.get_etag()[0] + '-gzip'
+    response = client.get('/books/list', headers={
+        'Accept-Encoding': 'gzip', 'If-None-Match': zipped.headers['ETag']
+    })
+    assert response.status_code == 304
+
+def test_small_responses_are_cached_uncompressed(client, sample_book):
+    client.get('/books/categories')
+    response = client.get('/books/categories', headers={'Accept-Encoding': 'gzip'})
+    assert response.content_encoding is None
+    assert response.json == {'categories': ['Test Category']}
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+import re
+import pytest
+from app import db
+from app.models import Book, Review, User, Cart, CartItem, Order, OrderItem, OrderStatusEnum
+
+def explain(stmt):
+    """Return the query plan for `stmt` as one lowercase string"""
+    engine = db.engine
+    sql = str(stmt.compile(engine, compile_kwargs={'literal_binds': True}))
+    with engine.connect() as conn:
+        if engine.dialect.name == 'postgresql':
+            # Tiny test tables would otherwise always favour a sequential scan
+            conn.exec_driver_sql('SET enable_seqscan = off')
+            rows = conn.exec_driver_sql('EXPLAIN ' + sql).all()
+            return '\n'.join(row[0] for row in rows).lower()
+        rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql).all()
+        return '\n'.join(row[-1] for row in rows).lower()
+
+@pytest.fixture
+def seeded(app):
+    user = User(email='plan@gmail.com', username='plan')
+    db.session.add(user)
+    db.session.flush()
+    cart = Cart(user_id=user.id)
+    db.session.add(cart)
+    for i in range(50):
+        book = Book(isbn=f'plan{i}', title=f'Plan Book {i}', author='Planner', price=5 + i,
+            stock=1, category=f'Category {i % 5}')
+        db.session.add(book)
+        db.session.flush()
+        db.session.add(Review(user_id=user.id, book_id=book.id, rating=1 + i % 5, comment='ok'))
+        order = Order(user_id=user.id, total_amount=book.price, shipping_address='Somewhere',
+            status=OrderStatusEnum.COMPLETED, order_date=datetime(2025, 1, 1) + timedelta(days=i))
+        db.session.add(order)
+        db.session.flush()
+        db.session.add(OrderItem(order_id=order.id, book_id=book.id, quantity=1, price_at_time=book.price))
+        if i < 5:
+            db.session.add(CartItem(cart_id=cart.id, book_id=book.id, quantity=1))
+    db.session.commit()
+
+# Reviews carry several overlapping indexes and planners differ on which one
+# fits best, so those queries only have to avoid a full scan of the table.
+# Sorted listings must also come out of the index already in order.
+ANY_REVIEWS_INDEX = 'any index on reviews'
+SORTED_REVIEWS_INDEX = 'any index on reviews, no sort'
+
+HOT_QUERIES = [
+    ('ix_books_category', lambda: db.select(Book).where(Book.category == 'Category 1')),
+    ('ix_books_price', lambda: db.select(Book).where(Book.price >= 30)),
+    (ANY_REVIEWS_INDEX, lambda: db.select(Review).where(Review.book_id == 3)),
+    (SORTED_REVIEWS_INDEX, lambda: db.select(Review).where(Review.book_id == 3).order_by(
+        Review.created_at.desc(), Review.id.desc()
+    )),
+    (SORTED_REVIEWS_INDEX, lambda: db.select(Review).where(Review.book_id == 3).order_by(
+        Review.rating.desc(), Review.created_at.desc(), Review.id.desc()
+    )),
+    (ANY_REVIEWS_INDEX, lambda: db.select(Review).where(Review.user_id == 1, Review.book_id == 3)),
+    (SORTED_REVIEWS_INDEX, lambda: db.select(Review).where(Review.user_id == 1).order_by(
+        Review.created_at.desc(), Review.id.desc()
+    )),
+    ('uq_cart_items_cart_id_book_id',
+        lambda: db.select(CartItem).where(CartItem.cart_id == 1, CartItem.book_id == 2)),
+    ('ix_carts_user_id', lambda: db.select(Cart).where(Cart.user_id == 1)),
+    ('ix_orders_user_id_order_date', lambda: db.select(Order).where(Order.user_id == 1)),
+    ('ix_orders_status_order_date', lambda: db.select(Order).where(
+        Order.status == OrderStatusEnum.COMPLETED,
+        Order.order_date.between(datetime(2025, 1, 1), datetime(2025, 1, 31))
+    )),
+    ('ix_order_items_order_id', lambda: db.select(OrderItem).where(OrderItem.order_id == 4)),
+    ('ix_order_items_book_id', lambda: db.select(OrderItem).where(OrderItem.book_id == 4)),
+]
+
+def uses_index_on(plan, table):
+    """True if the plan reads `table` through an index and never scans it in full"""
+    lines = plan.splitlines()
+    if db.engine.dialect.name == 'postgresql':
+        # Bitmap plans name the index and the table on separate lines
+        index_scan = re.compile(
+            rf'index (only )?scan (backward )?using \S+ on {table}\b'
+            rf'|bitmap index scan on (ix_{table}_|{table}_pkey)'
+        )
+        indexed = any(index_scan.search(line) for line in lines)
+        return indexed and not any(f'seq scan on {table}' in line for line in lines)
+    indexed = any(line.startswith(f'search {table} using') for line in lines)
+    return indexed and not any(line.startswith(f'scan {table}') for line in lines)
+
+def sorts_rows(plan):
+    """True if the plan has a sort step instead of reading rows in index order"""
+    if db.engine.dialect.name == 'postgresql':
+        return any(re.match(r'\s*(->\s+)?(incremental )?sort\s+\(', line) for line in plan.splitlines())
+    return 'use temp b-tree for order by' in plan
+
+@pytest.mark.parametrize('index_name, build_query', HOT_QUERIES,
+                         ids=[f'{name}-{i}' for i, (name, _) in enumerate(HOT_QUERIES)])
+def test_hot_query_uses_index(seeded, index_name, build_query):
+    plan = explain(build_query())
+    if index_name in (ANY_REVIEWS_INDEX, SORTED_REVIEWS_INDEX):
+        assert uses_index_on(plan, 'reviews'), f'expected an index scan of reviews in plan:\n{plan}'
+        if index_name == SORTED_REVIEWS_INDEX:
+            assert not sorts_rows(plan), f'expected rows in index order in plan:\n{plan}'
+    else:
+        assert index_name in plan, f'expected {index_name} in plan:\n{plan}'
@@ -0,0 +1,158 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+from app import db
+from app.models import Book, Review, User
+
+def test_export_books_ndjson(client, app, admin_header):
+    with app.app_context():
+        for i in range(3):
+            db.session.add(Book(isbn=f'x{i}', title=f'Export {i}', author='Author',
+                price=10 + i, stock=1, category='Fiction'))
+        db.session.commit()
+
+    response = client.get('/admin/books/export', headers=admin_header)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [row['title'] for row in rows] == ['Export 0', 'Export 1', 'Export 2']
+    assert rows[0]['updated_at'] is not None
+
+def test_export_books_csv_updated_since(client, app, admin_header):
+    with app.app_context():
+        old = Book(isbn='old', title='Old Book', author='Author', price=5, stock=1, category='Fiction',
+            updated_at=datetime.now() - timedelta(days=10))
+        new = Book(isbn='new', title='New Book', author='Author', price=5, stock=1, category='Fiction')
+        db.session.add_all([old, new])
+        db.session.commit()
+
+    since = (datetime.now() - timedelta(days=1)).isoformat()
+    response = client.get(f'/admin/books/export?format=csv&updated_since={since}', headers=admin_header)
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.data.decode())))
+    assert [row['title'] for row in rows] == ['New Book']
+
+    assert client.get('/admin/books/export?format=xml', headers=admin_header).status_code == 400
+    assert client.get('/admin/books/export?updated_since=yesterday', headers=admin_header).status_code == 400
+
+def test_bulk_import_books(client, app, admin_header):
+    with app.app_context():
+        db.session.add(Book(isbn='imp1', title='Old Title', author='Author', price=5, stock=1, category='Fiction'))
+        db.session.commit()
+
+    payload = '\n'.join([
+        json.dumps({'isbn': 'imp1', 'title': 'New Title', 'author': 'Author', 'price': 7, 'stock': 2, 'category': 'Fiction'}),
+        json.dumps({'isbn': 'imp2', 'title': 'Fresh Book', 'author': 'Writer', 'price': '9.5', 'stock': '4',
+                    'category': 'Poetry', 'publication_date': '2024-01-31'}),
+        json.dumps({'isbn': 'imp3', 'title': 'Missing Price', 'author': 'Writer', 'stock': 1, 'category': 'Poetry'}),
+        'not json'
+    ])
+    response = client.post('/admin/books/import', headers=admin_header,
+        data={'file': (io.BytesIO(payload.encode()), 'books.ndjson')})
+    assert response.status_code == 200
+    assert response.json['processed'] == 4
+    assert response.json['upserted'] == 2
+    assert [error['line'] for error in response.json['errors']] == [3, 4]
+
+    with app.app_context():
+        assert Book.query.count() == 2
+        assert Book.query.filter_by(isbn='imp1').one().title == 'New Title'
+        assert float(Book.query.filter_by(isbn='imp2').one().price) == 9.5
+
+    assert client.get('/books/search?q=fresh').json['total'] == 1
+
+def test_bulk_import_rejects_out_of_range_rows(client, app, admin_header, monkeypatch):
+    from sqlalchemy.exc import IntegrityError
+    from app.books import importer
+
+    upsert_books = importer.upsert_books
+    def reject_isbn_bad(rows):
+        if any(row['isbn'] == 'bad' for row in rows):
+            raise IntegrityError('INSERT INTO books', {}, Exception('constraint failed'))
+        return upsert_books(rows)
+    monkeypatch.setattr(importer, 'upsert_books', reject_isbn_bad)
+
+    book = {'author': 'Author', 'price': 5, 'stock': 1, 'category': 'Fiction'}
+    payload = '\n'.join(json.dumps(row) for row in [
+        {**book, 'isbn': 'ok1', 'title': 'Kept'},
+        {**book, 'isbn': 'long', 'title': 'x' * 256},
+        {**book, 'isbn': 'neg', 'title': 'Negative Stock', 'stock': -1},
+        {**book, 'isbn': 'nan', 'title': 'No Price', 'price': 'nan'},
+        {**book, 'isbn': 'bad', 'title': 'Rejected By Database'},
+        {**book, 'isbn': 'ok2', 'title': 'Also Kept'},
+    ])
+    response = client.post('/admin/books/import', headers=admin_header,
+        data={'file': (io.BytesIO(payload.encode()), 'books.ndjson')})
+    assert response.status_code == 200
+    assert response.json['upserted'] == 2
+    assert [error['line'] for error in response.json['errors']] == [2, 3, 4, 5]
+    assert 'title must be at most 255 characters' in response.json['errors'][0]['error']
+    assert 'constraint failed' in response.json['errors'][3]['error']
+
+    with app.app_context():
+        assert sorted(book.isbn for book in Book.query.all()) == ['ok1', 'ok2']
+
+def test_import_command_csv(app, tmp_path):
+    path = tmp_path / 'books.csv'
+    path.write_text('isbn,title,author,price,stock,category\n'
+                    'c1,Csv One,Author,3,1,Fiction\n'
+                    'c1,Csv One Again,Author,3,1,Fiction\n'
+                    'c2,Csv Two,Author,abc,1,Fiction\n')
+
+    result = app.test_cli_runner().invoke(args=['books', 'import', str(path)])
+    assert result.exit_code == 0
+    assert 'Processed 3 rows: 1 upserted, 1 rejected' in result.output
+
+    with app.app_context():
+        assert [book.title for book in Book.query.all()] == ['Csv One Again']
+
+def test_bulk_moderate_reviews(client, app, admin_header):
+    with app.app_context():
+        books = [Book(isbn=f'mod{i}', title=f'Moderated {i}', author='Author', price=10, stock=1,
+            category='Fiction') for i in range(2)]
+        users = [User(email=f'troll{i}@gmail.com', username=f'troll{i}') for i in range(2)]
+        db.session.add_all(books + users)
+        db.session.flush()
+        for book in books:
+            for user, rating in zip(users, (1, 5)):
+                db.session.add(Review(user_id=user.id, book_id=book.id, rating=rating, comment='text'))
+        db.session.flush()
+        Book.recompute_ratings()
+        db.session.commit()
+        book_ids = [book.id for book in books]
+        troll_id = users[0].id
+
+    response = client.post('/admin/reviews/moderate', headers=admin_header,
+        json={'action': 'hide', 'user_id': troll_id})
+    assert response.status_code == 200
+    assert response.json == {'action': 'hide', 'reviews': 2, 'book_ids': book_ids}
+
+    with app.app_context():
+        for book_id in book_ids:
+            book = db.session.get(Book, book_id)
+            assert (book.rating_count, book.average_rating) == (1, 5)
+            assert book.rating_histogram['1'] == 0
+    assert [r['rating'] for r in client.get(f'/api/books/{book_ids[0]}/reviews').json] == [5]
+
+    response = client.post('/admin/reviews/moderate', headers=admin_header,
+        json={'action': 'delete', 'book_id': book_ids[1]})
+    assert response.json['reviews'] == 2
+    with app.app_context():
+        assert Review.query.filter_by(book_id=book_ids[1]).count() == 0
+        assert db.session.get(Book, book_ids[1]).rating_count == 0
+
+    response = client.post('/admin/reviews/moderate', headers=admin_header,
+        json={'action': 'unhide', 'user_id': troll_id})
+    assert response.json['reviews'] == 1
+    with app.app_context():
+        assert db.session.get(Book, book_ids[0]).rating_count == 2
+
+    assert client.post('/admin/reviews/moderate', headers=admin_header,
+        json={'action': 'hide'}).status_code == 400
+    assert client.post('/admin/reviews/moderate', headers=admin_header,
+        json={'action': 'purge', 'user_id': troll_id}).status_code == 400
+    for payload in ({'review_ids': 'all'}, {'review_ids': [True]}, {'book_id': [1]},
+                    {'book_id': True}, {'user_id': '1'}, {'user_id': 1.5}):
+        assert client.post('/admin/reviews/moderate', headers=admin_header,
+            json={'action': 'hide', **payload}).status_code == 400
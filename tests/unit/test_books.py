@@ -1,6 +1,12 @@
-from app import db
-from app.models import Book
-from app.utils.cache import clear_all_cache
+from app import create_app, db
+from app.models import Book, Review, User, Order, OrderItem
+from app.utils.cache import clear_all_cache, invalidate_tags
+from app.books.search import PostgresSearchBackend
+from app.books.recommendations import cooccurrence_counts
+from app.books.suggest import index_book
+from tests.conftest import TestConfig
+import time
+import numpy as np
 
 def test_list_books(client, sample_book):
 
@@ -96,4 +102,407 @@ def test_get_categories(client, app):
 
 def test_book_not_found(client):
     response = client.get('/books/999')
-    assert response.status_code == 404 
\ No newline at end of file
+    assert response.status_code == 404 
+
+def test_average_rating_uses_stored_aggregates(app, sample_book):
+    with app.app_context():
+        book = db.session.get(Book, sample_book['id'])
+        book.add_rating(5)
+        book.add_rating(2)
+        db.session.commit()
+        assert book.rating_count == 2
+        assert book.average_rating == 3.5
+
+        assert book.rating_histogram == {'1': 0, '2': 1, '3': 0, '4': 0, '5': 1}
+
+        book.change_rating(2, 4)
+        book.remove_rating(5)
+        db.session.commit()
+        assert book.rating_count == 1
+        assert book.average_rating == 4
+        assert book.rating_histogram == {'1': 0, '2': 0, '3': 0, '4': 1, '5': 0}
+
+def test_recompute_ratings_command(app, sample_book):
+    with app.app_context():
+        user = User(email='rater@gmail.com', username='rater')
+        db.session.add(user)
+        db.session.commit()
+        for rating in (4, 5):
+            db.session.add(Review(user_id=user.id, book_id=sample_book['id'], rating=rating, comment='ok'))
+        db.session.commit()
+
+        result = app.test_cli_runner().invoke(args=['books', 'recompute-ratings'])
+        assert result.exit_code == 0
+
+        book = db.session.get(Book, sample_book['id'])
+        assert book.rating_count == 2
+        assert book.rating_sum == 9
+        assert book.average_rating == 4.5
+        assert book.rating_histogram == {'1': 0, '2': 0, '3': 0, '4': 1, '5': 1}
+
+def test_list_books_min_rating(client, app):
+    clear_all_cache()
+    with app.app_context():
+        books = [
+            Book(isbn='771', title='Loved Book', author='Author 1', price=10, stock=5,
+                category='Fiction', rating_count=2, rating_sum=9),
+            Book(isbn='772', title='Mixed Book', author='Author 2', price=10, stock=5,
+                category='Fiction', rating_count=4, rating_sum=12),
+            Book(isbn='773', title='Unrated Book', author='Author 3', price=10, stock=5,
+                category='Fiction')
+        ]
+        for book in books:
+            db.session.add(book)
+        db.session.commit()
+
+    response = client.get('/books/list?min_rating=4')
+    assert response.status_code == 200
+    assert response.json['total'] == 1
+    assert response.json['books'][0]['title'] == 'Loved Book'
+
+    response = client.get('/books/list?min_rating=3&per_page=1&page=2')
+    assert response.json['total'] == 2
+    assert response.json['total_pages'] == 2
+    assert len(response.json['books']) == 1
+
+def test_search_books_relevance_and_category(client, app):
+    clear_all_cache()
+    with app.app_context():
+        books = [
+            Book(isbn='881', title='Cooking Basics', author='Chef One', price=10, stock=5,
+                category='Food', description='Mentions python once'),
+            Book(isbn='882', title='Python Python', author='Python Guru', price=10, stock=5,
+                category='Programming', description='All about python'),
+            Book(isbn='883', title='Python Tricks', author='Coder', price=10, stock=5,
+                category='Programming')
+        ]
+        for book in books:
+            db.session.add(book)
+        db.session.commit()
+
+    response = client.get('/books/search?q=python')
+    assert response.status_code == 200
+    titles = [book['title'] for book in response.json['books']]
+    assert set(titles) == {'Python Python', 'Python Tricks', 'Cooking Basics'}
+    # Only the heavily matching book has a rank every backend agrees on
+    assert titles[0] == 'Python Python'
+
+    response = client.get('/books/search?q=pyth&category=Programming')
+    assert response.json['total'] == 2
+
+    response = client.get('/books/search?q=!!!')
+    assert response.json['total'] == 0
+
+    response = client.get('/books/list?q=python&category=Food')
+    assert [book['title'] for book in response.json['books']] == ['Cooking Basics']
+
+def test_search_index_follows_admin_writes(client, admin_header):
+    clear_all_cache()
+    response = client.post('/admin/books', json={
+        'isbn': '991', 'title': 'Gardening Today', 'author': 'Green Thumb',
+        'price': 12.5, 'stock': 3, 'category': 'Home'
+    }, headers=admin_header)
+    assert response.status_code == 201
+    book_id = response.json['id']
+
+    assert client.get('/books/search?q=gardening').json['total'] == 1
+
+    client.put(f'/admin/books/{book_id}', json={'title': 'Beekeeping Today'}, headers=admin_header)
+    clear_all_cache()
+    assert client.get('/books/search?q=gardening').json['total'] == 0
+    assert client.get('/books/search?q=beekeeping').json['total'] == 1
+
+    client.delete(f'/admin/books/{book_id}', headers=admin_header)
+    clear_all_cache()
+    assert client.get('/books/search?q=beekeeping').json['total'] == 0
+
+def test_list_books_cursor_pagination(client, app):
+    clear_all_cache()
+    with app.app_context():
+        for i, price in enumerate([30, 10, 20, 10, 40]):
+            db.session.add(Book(isbn=f'cur{i}', title=f'Cursor Book {i}', author='Author',
+                price=price, stock=1, category='Fiction'))
+        db.session.commit()
+
+    response = client.get('/books/list?cursor=&per_page=2&sort=price')
+    assert response.status_code == 200
+    assert 'total' not in response.json
+    prices = [book['price'] for book in response.json['books']]
+    seen = [book['id'] for book in response.json['books']]
+
+    while response.json['next_cursor']:
+        response = client.get(f"/books/list?cursor={response.json['next_cursor']}&per_page=2&sort=price")
+        assert response.status_code == 200
+        prices += [book['price'] for book in response.json['books']]
+        seen += [book['id'] for book in response.json['books']]
+
+    assert prices == [10, 10, 20, 30, 40]
+    assert len(set(seen)) == 5
+
+    response = client.get('/books/search?q=cursor&cursor=&per_page=10&sort=-id&include_total=true')
+    assert response.json['total'] == 5
+    assert response.json['next_cursor'] is None
+    ids = [book['id'] for book in response.json['books']]
+    assert ids == sorted(ids, reverse=True)
+
+def test_list_books_cursor_errors_and_count_skip(client, sample_book):
+    clear_all_cache()
+    response = client.get('/books/list?cursor=not-a-cursor')
+    assert response.status_code == 400
+
+    response = client.get('/books/list?sort=title')
+    assert response.status_code == 400
+
+    for per_page in (0, -5):
+        assert client.get(f'/books/list?cursor=&per_page={per_page}').status_code == 400
+        assert client.get(f'/books/list?per_page={per_page}').status_code == 400
+
+    response = client.get('/books/list?include_total=false')
+    assert response.status_code == 200
+    assert response.json['total'] is None
+    assert len(response.json['books']) == 1
+
+def test_suggest_books(client, app, admin_header):
+    with app.app_context():
+        db.session.add(Book(isbn='s1', title='Harry Potter', author='J. K. Rowling',
+            price=10, stock=1, category='Fiction'))
+        db.session.add(Book(isbn='s2', title='Harvest Moon', author='Harriet Vane',
+            price=10, stock=1, category='Fiction'))
+        db.session.commit()
+
+    response = client.get('/books/suggest?prefix=har')
+    assert response.status_code == 200
+    values = {(s['type'], s['value']) for s in response.json['suggestions']}
+    assert values == {('title', 'Harry Potter'), ('title', 'Harvest Moon'), ('author', 'Harriet Vane')}
+
+    response = client.get('/books/suggest?prefix=pott')
+    assert [s['value'] for s in response.json['suggestions']] == ['Harry Potter']
+
+    response = client.post('/admin/books', json={
+        'isbn': 's3', 'title': 'Potter and Clay', 'author': 'Ann Smith',
+        'price': 5, 'stock': 1, 'category': 'Crafts'
+    }, headers=admin_header)
+    book_id = response.json['id']
+    response = client.get('/books/suggest?prefix=potter')
+    assert {s['value'] for s in response.json['suggestions']} == {'Harry Potter', 'Potter and Clay'}
+
+    client.delete(f'/admin/books/{book_id}', headers=admin_header)
+    response = client.get('/books/suggest?prefix=potter')
+    assert [s['value'] for s in response.json['suggestions']] == ['Harry Potter']
+
+    assert client.get('/books/suggest?prefix=').json['suggestions'] == []
+
+def test_suggest_index_follows_other_workers(client, app):
+    with app.app_context():
+        book = Book(isbn='w1', title='Dune', author='Frank Herbert', price=10, stock=1, category='Fiction')
+        db.session.add(book)
+        db.session.commit()
+        book_id = book.id
+    assert [s['value'] for s in client.get('/books/suggest?prefix=dune').json['suggestions']] == ['Dune']
+
+    # Another worker sharing the Redis instance renames the book
+    other = create_app(TestConfig)
+    with other.app_context():
+        index_book(Book(id=book_id, title='Dune Messiah', author='Frank Herbert'))
+
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        values = [s['value'] for s in client.get('/books/suggest?prefix=dune').json['suggestions']]
+        if values == ['Dune Messiah']:
+            break
+        time.sleep(0.05)
+    assert values == ['Dune Messiah']
+    app.extensions['book_suggest_index'].subscription.stop()
+
+def test_get_books_batch(client, app, sample_book):
+    with app.app_context():
+        other = Book(isbn='b2', title='Second Book', author='Author', price=5, stock=1, category='Fiction')
+        db.session.add(other)
+        db.session.commit()
+        other_id = other.id
+
+    response = client.get(f"/books/batch?ids={other_id},{sample_book['id']},999")
+    assert response.status_code == 200
+    assert [book['id'] for book in response.json['books']] == [other_id, sample_book['id']]
+    assert response.json['missing'] == [999]
+
+    response = client.post('/books/batch', json={'ids': [sample_book['id'], sample_book['id']]})
+    assert response.status_code == 200
+    assert len(response.json['books']) == 1
+
+    app.config['BOOK_BATCH_MAX_IDS'] = 2
+    assert client.post('/books/batch', json={'ids': [1, 2, 3]}).status_code == 400
+    assert client.get('/books/batch?ids=1,abc').status_code == 400
+    assert client.get('/books/batch?ids=1.5').status_code == 400
+    assert client.post('/books/batch', json={'ids': [True]}).status_code == 400
+    assert client.post('/books/batch', json={'ids': [1.5]}).status_code == 400
+    assert client.post('/books/batch', json={'ids': ['1']}).status_code == 400
+    assert client.get('/books/batch?ids=99999999999999999999999').status_code == 400
+    assert client.post('/books/batch', json={'ids': [2 ** 31]}).status_code == 400
+    assert client.post('/books/batch', json={'ids': [0]}).status_code == 400
+    assert client.get('/books/batch').status_code == 400
+
+def test_book_fields_projection(client, sample_book):
+    clear_all_cache()
+    response = client.get('/books/list?fields=title,price')
+    assert response.status_code == 200
+    assert response.json['books'][0] == {'id': sample_book['id'], 'title': 'Test Book', 'price': 29.99}
+
+    response = client.get('/books/list')
+    assert 'description' in response.json['books'][0]
+    assert 'rating_histogram' not in response.json['books'][0]
+
+    response = client.get('/books/list?fields=title,rating_histogram')
+    assert response.json['books'][0]['rating_histogram'] == {'1': 0, '2': 0, '3': 0, '4': 0, '5': 0}
+    assert 'rating_histogram' in client.get(f"/books/{sample_book['id']}").json
+
+    response = client.get('/books/search?q=test&fields=author,average_rating&cursor=&sort=price')
+    assert set(response.json['books'][0]) == {'id', 'author', 'average_rating'}
+
+    response = client.get(f"/books/{sample_book['id']}?fields=title")
+    assert response.json == {'id': sample_book['id'], 'title': 'Test Book'}
+
+    response = client.get(f"/books/{sample_book['id']}?fields=title,reviews")
+    assert response.json['reviews'] == []
+
+    assert client.get('/books/list?fields=title,secret').status_code == 400
+
+def test_conditional_get_book(client, sample_book, admin_header):
+    clear_all_cache()
+    response = client.get(f"/books/{sample_book['id']}")
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    response = client.get(f"/books/{sample_book['id']}", headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    response = client.get(f"/books/{sample_book['id']}?fields=title", headers={'If-None-Match': etag})
+    assert response.status_code == 200
+
+    client.put(f"/admin/books/{sample_book['id']}", json={'stock': 3}, headers=admin_header)
+    response = client.get(f"/books/{sample_book['id']}", headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+def test_conditional_get_catalog(client, app, sample_book):
+    clear_all_cache()
+    for url in ('/books/list', '/books/categories', f"/api/books/{sample_book['id']}/reviews"):
+        etag = client.get(url).headers['ETag']
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    etag = client.get('/books/categories').headers['ETag']
+    with app.app_context():
+        db.session.add(Book(isbn='e2', title='New', author='A', price=1, stock=1, category='Poetry'))
+        db.session.commit()
+        invalidate_tags('catalog')
+    assert client.get('/books/categories', headers={'If-None-Match': etag}).status_code == 200
+
+def test_get_facets(client, app):
+    clear_all_cache()
+    with app.app_context():
+        books = [
+            Book(isbn='f1', title='Cheap Fiction', author='A', price=5, stock=1, category='Fiction',
+                rating_count=1, rating_sum=5),
+            Book(isbn='f2', title='Mid Fiction', author='B', price=15, stock=1, category='Fiction',
+                rating_count=2, rating_sum=7),
+            Book(isbn='f3', title='Pricey Science', author='C', price=150, stock=1, category='Science')
+        ]
+        db.session.add_all(books)
+        db.session.commit()
+
+    response = client.get('/books/facets')
+    assert response.status_code == 200
+    assert response.json['total'] == 3
+    assert response.json['categories'] == [
+        {'category': 'Fiction', 'count': 2}, {'category': 'Science', 'count': 1}
+    ]
+    assert [bucket['count'] for bucket in response.json['price_ranges']] == [1, 1, 0, 0, 1]
+    assert response.json['price_ranges'][-1] == {'min': 100, 'max': None, 'count': 1}
+    assert [bucket['count'] for bucket in response.json['ratings']] == [1, 0, 0, 1, 0, 1]
+
+    response = client.get('/books/facets?category=Fiction&max_price=10')
+    assert response.json['total'] == 1
+    assert response.json['categories'] == [{'category': 'Fiction', 'count': 1}]
+
+    response = client.get('/books/facets?q=science')
+    assert response.json['categories'] == [{'category': 'Science', 'count': 1}]
+
+def test_related_books_from_orders(client, app):
+    clear_all_cache()
+    with app.app_context():
+        user = User(email='buyer@gmail.com', username='buyer')
+        db.session.add(user)
+        books = [Book(isbn=f'r{i}', title=f'Related {i}', author='A', price=5, stock=9, category='Fiction')
+            for i in range(4)]
+        db.session.add_all(books)
+        db.session.commit()
+        ids = [book.id for book in books]
+
+        def place_order(*book_ids):
+            order = Order(user_id=user.id, total_amount=5, shipping_address='Here')
+            db.session.add(order)
+            db.session.flush()
+            for book_id in book_ids:
+                db.session.add(OrderItem(order_id=order.id, book_id=book_id, quantity=1, price_at_time=5))
+            db.session.commit()
+
+        place_order(ids[0], ids[1], ids[2])
+        place_order(ids[0], ids[1])
+
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=['books', 'build-recommendations', '--chunk-size', '1'])
+        assert result.exit_code == 0
+        assert 'Scanned 5 order items' in result.output
+
+        response = client.get(f'/books/{ids[0]}/related')
+        assert response.status_code == 200
+        assert [(r['book']['id'], r['score']) for r in response.json['related']] == [(ids[1], 2), (ids[2], 1)]
+
+        # Only the new order is scanned on the next run
+        place_order(ids[2], ids[3])
+        place_order(ids[2], ids[3])
+        result = runner.invoke(args=['books', 'build-recommendations'])
+        assert 'Scanned 4 order items' in result.output
+
+        related = client.get(f'/books/{ids[2]}/related').json['related']
+        assert [(r['book']['id'], r['score']) for r in related] == [(ids[3], 2), (ids[0], 1), (ids[1], 1)]
+
+        assert client.get('/books/999999/related').status_code == 404
+
+def test_related_books_404_is_dropped_when_the_book_is_created(client, app, admin_header):
+    clear_all_cache()
+    with app.app_context():
+        next_id = (db.session.query(db.func.max(Book.id)).scalar() or 0) + 1
+    assert client.get(f'/books/{next_id}/related').status_code == 404
+
+    response = client.post('/admin/books', json={
+        'isbn': '992', 'title': 'New Arrival', 'author': 'Author',
+        'price': 5, 'stock': 1, 'category': 'Fiction'
+    }, headers=admin_header)
+    assert response.json['id'] == next_id
+
+    response = client.get(f'/books/{next_id}/related?limit=-1')
+    assert response.status_code == 200
+    assert response.json['related'] == []
+
+def test_cooccurrence_counts_caps_large_baskets():
+    order_ids = np.array([1] * 5 + [2, 2], dtype=np.int64)
+    book_ids = np.array([1, 2, 3, 4, 5, 1, 5], dtype=np.int64)
+
+    def pairs(max_basket):
+        books, related, counts = cooccurrence_counts(order_ids, book_ids, max_basket=max_basket)
+        return {(int(a), int(b)): int(c) for a, b, c in zip(books, related, counts) if a < b}
+
+    # Order 1 has every pair of its 5 books; the second order adds to (1, 5)
+    assert len(pairs(5)) == 10
+    assert pairs(5)[1, 5] == 2
+    # With max_basket=3 the 5-book order only pairs books at most 2 positions apart
+    assert set(pairs(3)) == {(1, 2), (2, 3), (3, 4), (4, 5), (1, 3), (2, 4), (3, 5), (1, 5)}
+    assert pairs(3)[1, 5] == 1
+
+def test_postgres_search_matches_prefixes():
+    backend = PostgresSearchBackend()
+    assert backend.tsquery_text('pyth') == 'pyth:*'
+    assert backend.tsquery_text('Python tricks!') == 'Python:* & tricks:*'
+    assert backend.tsquery_text('!!!') == ''
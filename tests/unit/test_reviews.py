@@ -0,0 +1,198 @@
+from contextlib import contextmanager
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+from app import db
+from app.models import Book, Review, User, Order, OrderItem, OrderStatusEnum, PurchasedBook
+from app.reviews.analytics import load_nltk_resources
+from app.utils.cache import clear_all_cache
+
+def has_nltk_data():
+    try:
+        load_nltk_resources()
+    except LookupError:
+        return False
+    return True
+
+@contextmanager
+def count_queries():
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+@pytest.fixture
+def reviewed_book(app):
+    clear_all_cache()
+    book = Book(isbn='rev1', title='Much Reviewed', author='Author', price=10, stock=5, category='Fiction')
+    db.session.add(book)
+    db.session.flush()
+    for i in range(12):
+        user = User(email=f'reader{i}@gmail.com', username=f'reader{i}')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Review(user_id=user.id, book_id=book.id, rating=1 + i % 5, comment=f'Review {i}'))
+    db.session.flush()
+    Book.recompute_ratings([book.id])
+    db.session.commit()
+    return book.id
+
+def test_book_detail_embeds_first_review_page(client, reviewed_book):
+    with count_queries() as statements:
+        response = client.get(f'/books/{reviewed_book}')
+    assert response.status_code == 200
+    assert [r['comment'] for r in response.json['reviews']] == [f'Review {i}' for i in range(11, 6, -1)]
+    assert response.json['reviews'][0]['user']['username'] == 'reader11'
+    # ETag version, book, and one joined query for the review page
+    assert len(statements) == 3
+
+    cursor = response.json['reviews_next_cursor']
+    response = client.get(f'/api/books/{reviewed_book}/reviews?cursor={cursor}')
+    assert response.status_code == 200
+    assert [r['comment'] for r in response.json] == [f'Review {i}' for i in range(6, -1, -1)]
+    assert 'X-Next-Cursor' not in response.headers
+
+def test_book_reviews_next_page_headers(client, reviewed_book):
+    response = client.get(f'/api/books/{reviewed_book}/reviews?per_page=10')
+    assert len(response.json) == 10
+    cursor = response.headers['X-Next-Cursor']
+    assert 'rel="next"' in response.headers['Link']
+
+    response = client.get(f'/api/books/{reviewed_book}/reviews?per_page=10&cursor={cursor}')
+    assert len(response.json) == 2
+
+    assert client.get(f'/api/books/{reviewed_book}/reviews?cursor=bogus').status_code == 400
+
+def test_rating_summary(client, reviewed_book):
+    with count_queries() as statements:
+        response = client.get(f'/api/books/{reviewed_book}/rating-summary')
+    assert response.status_code == 200
+    # ETag version plus one primary-key lookup, however many reviews there are
+    assert len(statements) == 2
+    assert response.json['rating_count'] == 12
+    assert response.json['histogram'] == {'1': 3, '2': 3, '3': 2, '4': 2, '5': 2}
+    assert client.get(f'/books/{reviewed_book}').json['rating_histogram'] == response.json['histogram']
+    assert client.get('/api/books/9999/rating-summary').status_code == 404
+
+def test_book_reviews_sorted_by_rating(client, reviewed_book):
+    pages, cursor = [], None
+    while True:
+        url = f'/api/books/{reviewed_book}/reviews?sort=highest&per_page=5'
+        with count_queries() as statements:
+            response = client.get(url + (f'&cursor={cursor}' if cursor else ''))
+        # ETag version plus one joined query for the page
+        assert len(statements) == 2
+        pages.extend(response.json)
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+    assert [r['rating'] for r in pages] == sorted((1 + i % 5 for i in range(12)), reverse=True)
+    # Ties on rating come newest first
+    assert [r['comment'] for r in pages[:4]] == ['Review 9', 'Review 4', 'Review 8', 'Review 3']
+
+    response = client.get(f'/api/books/{reviewed_book}/reviews?sort=lowest&per_page=3')
+    assert [r['rating'] for r in response.json] == [1, 1, 1]
+    # A cursor only continues the sort it came from
+    cursor = response.headers['X-Next-Cursor']
+    assert client.get(f'/api/books/{reviewed_book}/reviews?sort=highest&cursor={cursor}').status_code == 400
+    assert client.get(f'/api/books/{reviewed_book}/reviews?sort=oldest').status_code == 400
+    assert client.get('/api/books/9999/reviews').status_code == 404
+
+def test_user_reviews_paginated(app, client, reviewed_book):
+    user = User(email='prolific@gmail.com', username='prolific')
+    db.session.add(user)
+    db.session.flush()
+    for i in range(3):
+        book = Book(isbn=f'prolific{i}', title=f'Book {i}', author='Author', price=10, stock=5, category='Fiction')
+        db.session.add(book)
+        db.session.flush()
+        db.session.add(Review(user_id=user.id, book_id=book.id, rating=5, comment=f'Mine {i}'))
+    db.session.commit()
+    headers = {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+
+    with count_queries() as statements:
+        response = client.get('/api/users/reviews?per_page=2', headers=headers)
+    assert len(statements) == 1
+    assert [r['comment'] for r in response.json] == ['Mine 2', 'Mine 1']
+    assert response.json[0]['user']['username'] == 'prolific'
+
+    cursor = response.headers['X-Next-Cursor']
+    response = client.get(f'/api/users/reviews?per_page=2&cursor={cursor}', headers=headers)
+    assert [r['comment'] for r in response.json] == ['Mine 0']
+    assert 'X-Next-Cursor' not in response.headers
+
+def test_completing_order_grants_review_entitlement(client, app, admin_header):
+    user = User(email='buyer@gmail.com', username='buyer')
+    book = Book(isbn='ent1', title='Entitled', author='Author', price=10, stock=5, category='Fiction')
+    db.session.add_all([user, book])
+    db.session.flush()
+    order = Order(user_id=user.id, total_amount=10, shipping_address='Somewhere', status=OrderStatusEnum.PENDING)
+    db.session.add(order)
+    db.session.flush()
+    db.session.add(OrderItem(order_id=order.id, book_id=book.id, quantity=1, price_at_time=10))
+    db.session.commit()
+    user_id, book_id, order_id = user.id, book.id, order.id
+    headers = {'Authorization': f'Bearer {create_access_token(identity=str(user_id))}'}
+    review = {'rating': 4, 'comment': 'Good'}
+
+    assert client.post(f'/api/books/{book_id}/reviews', json=review, headers=headers).status_code == 403
+
+    response = client.put(f'/admin/orders/{order_id}/status', json={'status': 'completed'}, headers=admin_header)
+    assert response.status_code == 200
+    assert db.session.get(PurchasedBook, (user_id, book_id)).order_id == order_id
+    response = client.get('/api/users/purchased-books', headers=headers)
+    assert [(p['book_id'], p['review_id']) for p in response.json] == [(book_id, None)]
+
+    assert client.post(f'/api/books/{book_id}/reviews', json=review, headers=headers).status_code == 201
+    assert client.get('/api/users/purchased-books', headers=headers).json[0]['review_id'] is not None
+
+    response = client.put(f'/admin/orders/{order_id}/status', json={'status': 'CANCELLED'}, headers=admin_header)
+    assert response.status_code == 200
+    assert db.session.get(PurchasedBook, (user_id, book_id)) is None
+    assert client.put(f'/admin/orders/{order_id}/status', json={'status': 'lost'},
+        headers=admin_header).status_code == 400
+
+@pytest.mark.skipif(not has_nltk_data(), reason='nltk vader_lexicon/stopwords not downloaded')
+def test_analyze_reviews_incrementally(app, client, reviewed_book):
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['reviews', 'analyze', '--processes', '2', '--chunk-size', '5'])
+    assert result.exit_code == 0, result.output
+    assert 'Analyzed 12 review(s)' in result.output
+
+    clear_all_cache()
+    summary = client.get(f'/books/{reviewed_book}/review-summary').json
+    assert summary['review_count'] == 12
+    assert summary['keywords'][0] == {'term': 'review', 'count': 12}
+
+    review = Review.query.filter_by(book_id=reviewed_book, comment='Review 0').one()
+    review.comment = 'A wonderful, delightful story'
+    db.session.commit()
+    result = runner.invoke(args=['reviews', 'analyze', '--processes', '1'])
+    assert 'Analyzed 1 review(s)' in result.output
+
+    clear_all_cache()
+    summary = client.get(f'/books/{reviewed_book}/review-summary').json
+    assert summary['sentiment']['positive'] == 1
+    assert {'term': 'wonderful', 'count': 1} in summary['keywords']
+    assert client.get('/books/9999/review-summary').status_code == 404
+
+@pytest.mark.parametrize('added, removed', [(5, None), (None, 3), (4, 2), (4, 4)])
+def test_rating_increments_bind_ints_on_postgresql(added, removed):
+    stmt = db.update(Book).where(Book.id == 1).values(**Book._rating_increments(added, removed))
+    compiled = stmt.compile(dialect=postgresql.dialect())
+    for name, value in compiled.params.items():
+        if name != 'updated_at':
+            assert type(value) is int, (name, value)
+    sql = str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True})).lower()
+    assert 'true' not in sql and 'false' not in sql
+
+def test_review_pages_clamp_per_page(client, reviewed_book):
+    for per_page in (0, -5):
+        response = client.get(f'/api/books/{reviewed_book}/reviews?per_page={per_page}')
+        assert response.status_code == 200
+        assert len(response.json) == 1